@@ -0,0 +1,331 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Benchmarks of the sequana_sphinxext directives
+
+A local HTTP server stands in for raw.githubusercontent.com and serves
+synthetic wrapper READMEs, pipeline READMEs and rules files (with ETag
+support and an optional latency). Sphinx projects with N directives of each
+kind are generated and built in the following scenarios:
+
+- cold: empty cache and environment
+- warm: all pages re-read, documents served by the on-disk cache
+- incremental: one upstream document changed; all documents are revalidated
+  and only the affected page is re-read
+- parallel: cold build with sphinx-build -j N
+
+Results are saved as JSON (see --output) and can be compared with the
+results of a previous release::
+
+    python benchmarks/run_benchmarks.py --sizes 10 100 1000 --jobs 1 4
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/1.0.0.json
+
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import posixpath
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import sphinx
+from sphinx.application import Sphinx
+
+
+KINDS = {
+    "wrapper": "sequana_wrapper",
+    "pipeline": "sequana_pipeline",
+    "snakemakerule": "snakemakerule",
+}
+
+DIRECTIVES_PER_PAGE = 10
+
+CONF = """
+extensions = [
+    "sequana_sphinxext.snakemakerule",
+    "sequana_sphinxext.pipeline",
+    "sequana_sphinxext.wrapper",
+]
+master_doc = "index"
+project = "benchmark"
+sequana_sphinxext_sources = [("http", "{url}")]
+# rules are served by the local server even if sequana_pipetools is installed
+sequana_sphinxext_use_pipetools = False
+sequana_sphinxext_cache_ttl = 86400
+"""
+
+
+def wrapper_readme(name, revision):
+    return f"""# Documentation
+
+The **{name}** wrapper (revision {revision}) runs a tool on the input files
+and produces a report. {"Lorem ipsum dolor sit amet. " * 20}
+
+# Configuration
+
+    {name}:
+        options: "--threads 4"
+        threads: 4
+
+# Example
+
+    rule {name}:
+        input: "{{sample}}.fastq.gz"
+        output: "{name}/{{sample}}.html"
+        params: options=config["{name}"]["options"]
+        wrapper: "main/wrappers/{name}"
+
+# References
+
+* https://github.com/sequana/sequana-wrappers
+"""
+
+
+def pipeline_readme(name, revision):
+    return f"""{name} pipeline
+{"#" * (len(name) + 9)}
+
+Overview
+========
+
+The {name} pipeline (revision {revision}). {"Lorem ipsum dolor sit amet. " * 20}
+
+Installation
+============
+
+::
+
+    pip install sequana_{name}
+
+Usage
+=====
+
+::
+
+    sequana_{name} --input-directory DATAPATH
+"""
+
+
+def rules_file(name, revision):
+    return f'''
+rule {name}:
+    """The {name} rule (revision {revision})
+
+    {"Lorem ipsum dolor sit amet. " * 10}
+    """
+    input: "{{sample}}.fastq.gz"
+    output: "{name}/{{sample}}.txt"
+    shell: "{name} {{input}} > {{output}}"
+'''
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serve synthetic documents with the raw.githubusercontent.com layout"""
+
+    def log_message(self, *args):
+        pass
+
+    def _content(self):
+        path = posixpath.normpath(self.path).strip("/").split("/")
+        revision = self.server.revisions.get(path[-2] if len(path) > 1 else "", 0)
+        if path[:3] == ["sequana-wrappers", "main", "wrappers"] and path[-1] == "README.md":
+            return wrapper_readme(path[3], revision)
+        if path[:4] == ["sequana", "master", "sequana", "rules"] and path[-1].endswith(".rules"):
+            return rules_file(path[4], revision)
+        if len(path) == 3 and path[1:] == ["master", "README.rst"]:
+            return pipeline_readme(path[0], self.server.revisions.get(path[0], 0))
+        return None
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+        content = self._content()
+        if content is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        content = content.encode("utf8")
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start_server(latency):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.revisions = {}
+    server.requests = 0
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def create_project(directory, kind, size, url):
+    """Create a Sphinx project with *size* directives of a given kind"""
+    os.makedirs(directory)
+    with open(os.path.join(directory, "conf.py"), "w") as fh:
+        fh.write(CONF.format(url=url))
+    with open(os.path.join(directory, "index.rst"), "w") as fh:
+        fh.write("Benchmark\n=========\n\n.. toctree::\n    :glob:\n\n    page*\n")
+
+    names = [f"{kind}{i}" for i in range(size)]
+    for page, start in enumerate(range(0, size, DIRECTIVES_PER_PAGE)):
+        with open(os.path.join(directory, f"page{page}.rst"), "w") as fh:
+            fh.write(f"Page {page}\n==========\n\n")
+            for name in names[start : start + DIRECTIVES_PER_PAGE]:
+                fh.write(f".. {KINDS[kind]}:: {name}\n\n")
+    return names
+
+
+def build(directory, freshenv=False, parallel=1, overrides=None):
+    """Build a project in html and return the elapsed time"""
+    start = time.perf_counter()
+    app = Sphinx(
+        directory,
+        directory,
+        os.path.join(directory, "_build", "html"),
+        os.path.join(directory, "_build", "doctrees"),
+        "html",
+        confoverrides=overrides or {},
+        status=None,
+        warning=io.StringIO(),
+        freshenv=freshenv,
+        parallel=parallel,
+    )
+    app.build()
+    return time.perf_counter() - start
+
+
+def run_benchmarks(kinds, sizes, jobs, latency, workdir):
+    server = start_server(latency)
+    url = f"http://127.0.0.1:{server.server_port}"
+    results = []
+
+    def measure(kind, size, scenario, njobs, func):
+        server.requests = 0
+        seconds = func()
+        result = {
+            "kind": kind,
+            "size": size,
+            "scenario": scenario,
+            "jobs": njobs,
+            "seconds": round(seconds, 4),
+            "requests": server.requests,
+        }
+        print(f"{kind:15} {size:6} {scenario:12} -j {njobs:<3} {seconds:9.3f}s {server.requests:6} requests")
+        results.append(result)
+
+    try:
+        for kind in kinds:
+            for size in sizes:
+                directory = os.path.join(workdir, f"{kind}-{size}")
+                names = create_project(directory, kind, size, url)
+                measure(kind, size, "cold", 1, lambda: build(directory))
+                measure(kind, size, "warm", 1, lambda: build(directory, freshenv=True))
+                server.revisions[names[0]] = server.revisions.get(names[0], 0) + 1
+                measure(
+                    kind,
+                    size,
+                    "incremental",
+                    1,
+                    lambda: build(directory, overrides={"sequana_sphinxext_cache_ttl": 0}),
+                )
+                for njobs in jobs:
+                    if njobs == 1:
+                        continue
+                    directory = os.path.join(workdir, f"{kind}-{size}-j{njobs}")
+                    create_project(directory, kind, size, url)
+                    measure(kind, size, "parallel", njobs, lambda: build(directory, parallel=njobs))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def compare(results, previous, threshold):
+    """Print the ratio between the current and previous timings"""
+    reference = {(x["kind"], x["size"], x["scenario"], x["jobs"]): x["seconds"] for x in previous["results"]}
+    regressions = 0
+    print(f"\nComparison with {previous['version']} ({previous['date']})")
+    for result in results:
+        key = (result["kind"], result["size"], result["scenario"], result["jobs"])
+        if key not in reference:
+            continue
+        ratio = result["seconds"] / max(reference[key], 1e-6)
+        flag = "REGRESSION" if ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"{key[0]:15} {key[1]:6} {key[2]:12} -j {key[3]:<3} {ratio:6.2f}x {flag}")
+    return regressions
+
+
+def get_version():
+    try:
+        from importlib import metadata
+
+        return metadata.version("sequana_sphinxext")
+    except Exception:
+        return "dev"
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--kinds", nargs="+", choices=sorted(KINDS), default=sorted(KINDS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--jobs", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--latency", type=float, default=20, help="latency of the server in ms")
+    parser.add_argument("--output", help="JSON file (default: benchmarks/results/<version>.json)")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slow-down reported as a regression")
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_benchmarks(args.kinds, args.sizes, args.jobs, args.latency / 1000, workdir)
+
+    report = {
+        "version": get_version(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "sphinx": sphinx.__version__,
+        "latency_ms": args.latency,
+        "results": results,
+    }
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{report['version']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Results saved in {output}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            if compare(results, json.load(fh), args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Command line tools of sequana_sphinxext
+
+::
+
+    python -m sequana_sphinxext snapshot doc/ -o sequana_bundle.zip
+
+"""
+import argparse
+import sys
+
+
+def snapshot(args):
+    from sequana_sphinxext.snapshot import create_snapshot
+
+    index, missing = create_snapshot(args.srcdir, args.output, confdir=args.confdir, status=sys.stderr)
+    print(f"{len(index['documents'])} document(s) saved in {args.output}")
+    for url in missing:
+        print(f"Could not fetch {url}", file=sys.stderr)
+    return 1 if missing and args.strict else 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m sequana_sphinxext")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_snapshot = subparsers.add_parser(
+        "snapshot", help="save the documents used by a Sphinx project in a bundle (see sequana_sphinxext_bundle)"
+    )
+    parser_snapshot.add_argument("srcdir", help="source directory of the Sphinx project")
+    parser_snapshot.add_argument("-c", "--confdir", help="directory of the conf.py file (default: srcdir)")
+    parser_snapshot.add_argument("-o", "--output", default="sequana_bundle.zip", help="the bundle to create")
+    parser_snapshot.add_argument(
+        "--strict", action="store_true", help="exit with an error if some documents could not be fetched"
+    )
+    parser_snapshot.set_defaults(func=snapshot)
+
+    args = parser.parse_args(args)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Asyncio fetch engine
+
+Set **sequana_sphinxext_fetch_backend = "asyncio"** in the conf.py file to
+prefetch the documents with coroutines instead of a pool of threads. All
+coroutines run on a single event loop started in a background thread for the
+build; the number of concurrent fetches is still set by
+**sequana_sphinxext_prefetch_workers** but no thread is needed per fetch, so
+large catalogues can be fetched with a high concurrency.
+
+If :mod:`aiohttp` is installed, it is used as HTTP client with keep-alive
+connections (at most **sequana_sphinxext_pool_size** per host). Otherwise,
+the requests are sent by the shared :class:`requests.Session` in the default
+executor of the loop.
+
+The documents go through the same memory, sources, on-disk cache, circuit
+breaker and size limit as :func:`sequana_sphinxext.fetch.fetch`; directives
+then read them from memory. Unlike the threaded fetches, downloads are not
+coordinated across processes sharing the cache. The loop does not survive a
+fork: each parallel reader starts its own loop on first use.
+
+"""
+import asyncio
+import atexit
+import os
+import threading
+import time
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from sequana_sphinxext import fetch
+from sequana_sphinxext import metrics
+from sequana_sphinxext.fetch import FetchError, HTTPProvider
+
+
+# connection errors and timeouts
+_NETWORK_ERRORS = (requests.RequestException, OSError, asyncio.TimeoutError)
+if aiohttp is not None:
+    _NETWORK_ERRORS += (aiohttp.ClientError,)
+
+_loop = None
+_loop_lock = threading.Lock()
+# aiohttp session (created in the loop) and the options used to create it
+_client = None
+_client_options = None
+
+
+def _reset():
+    # the loop thread is not running in a forked process (e.g. the parallel
+    # readers of Sphinx) and the aiohttp session belongs to the parent loop
+    global _loop, _loop_lock, _client, _client_options
+    _loop = None
+    _loop_lock = threading.Lock()
+    _client = None
+    _client_options = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def get_loop():
+    """Return the event loop shared by the build (started on first use)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="sequana_sphinxext", daemon=True).start()
+        return _loop
+
+
+def run(coroutine):
+    """Run a coroutine on the shared loop and return its result"""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop()).result()
+
+
+def prefetch(urls, concurrency=8):
+    """Fetch concurrently all *urls* so that :func:`~sequana_sphinxext.fetch.fetch`
+    reads them from memory
+
+    Failures are ignored here; they are reported when the directive fetches
+    the document again. Documents that already failed are not fetched again.
+    """
+    urls = [url for url in set(urls) if url not in fetch._memory and url not in fetch._errors]
+    if urls and concurrency > 0:
+        run(_prefetch(urls, concurrency))
+
+
+async def _prefetch(urls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _prefetch_one(url):
+        async with semaphore:
+            try:
+                await fetch_async(url)
+            except FetchError:
+                pass
+
+    await asyncio.gather(*[_prefetch_one(url) for url in urls])
+
+
+async def fetch_async(url):
+    """Coroutine returning the content of *url* as a string
+
+    See :func:`sequana_sphinxext.fetch.fetch`.
+
+    :raises FetchError: if the document is not available or too large.
+    """
+    future, owner = fetch._claim(url)
+    if owner:
+        try:
+            content = await _get(url)
+        except Exception as err:
+            fetch._settle(url, future, error=err)
+        else:
+            fetch._settle(url, future, content)
+    return await asyncio.wrap_future(future)
+
+
+async def _get(url):
+    # same fallback between sources as fetch._get
+    error = None
+    for provider in fetch._providers or [HTTPProvider()]:
+        start = time.perf_counter()
+        try:
+            if isinstance(provider, HTTPProvider):
+                return await _download(provider.resolve(url))
+            # local sources are read directly
+            content = provider.get(url)
+        except FetchError as err:
+            error = err
+            continue
+        if content is not None:
+            metrics.record_fetch(url, "local", len(content), time.perf_counter() - start)
+            return content
+    raise error or FetchError(url, "not found in the configured sources")
+
+
+async def _download(url):
+    cache = fetch._cache
+    start = time.perf_counter()
+    entry = cache.get(url) if cache else None
+    content = fetch._cached(url, entry, start)
+    if content is None:
+        content = fetch._check_host(url, entry, start)
+    if content is not None:
+        return content
+
+    try:
+        status, headers, content = await _request(url, cache.validators(entry) if entry else {})
+    except _NETWORK_ERRORS as err:
+        return fetch._network_error(url, entry, err, start)
+
+    cached = fetch._check_response(url, entry, status, start)
+    if cached is not None:
+        return cached
+    return fetch._store(url, content, headers, len(content), start)
+
+
+async def _request(url, headers):
+    # return the (status, headers, content) of a GET request; the content is
+    # only read for a 200 response
+    if aiohttp is None:
+        return await asyncio.get_running_loop().run_in_executor(None, _blocking_request, url, headers)
+
+    retries = fetch._http["retries"]
+    for attempt in range(retries + 1):
+        if attempt:
+            # exponential backoff, as the requests session
+            await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+        try:
+            async with (await _get_client()).get(url, headers=headers) as r:
+                if r.status in (429, 500, 502, 503, 504) and attempt < retries:
+                    continue
+                content = b""
+                if r.status == 200:
+                    fetch._check_size(url, 0, r.headers.get("Content-Length"))
+                    chunks, size = [], 0
+                    async for chunk in r.content.iter_chunked(64 * 1024):
+                        size += len(chunk)
+                        fetch._check_size(url, size)
+                        chunks.append(chunk)
+                    content = b"".join(chunks)
+                return r.status, r.headers, content
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == retries:
+                raise
+
+
+def _blocking_request(url, headers):
+    r = fetch.get_session().get(url, headers=headers, timeout=fetch._http["timeout"], stream=True)
+    with r:
+        content = fetch._read_content(url, r) if r.status_code == 200 else b""
+    return r.status_code, r.headers, content
+
+
+async def _get_client():
+    # one session per build; created again if the HTTP options changed
+    global _client, _client_options
+    options = (tuple(fetch._http["timeout"]), fetch._http["pool_size"])
+    if _client is None or options != _client_options:
+        if _client is not None:
+            await _client.close()
+        connect, read = options[0]
+        _client = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=options[1]),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+        )
+        _client_options = options
+    return _client
+
+
+async def _close():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+@atexit.register
+def _shutdown():
+    if _loop is not None and _loop.is_running():
+        run(_close())
+        _loop.call_soon_threadsafe(_loop.stop)
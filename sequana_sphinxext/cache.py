@@ -0,0 +1,251 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""On-disk cache of remote documents
+
+The wrappers, pipelines and rules documentation is fetched from GitHub. This
+module stores the downloaded content on disk so that subsequent builds can
+revalidate it (ETag / Last-Modified) instead of downloading it again.
+
+The cache is content-addressed: the metadata of a URL is stored in
+``<sha256(url)>.json`` while the content itself is stored in
+``<sha256(content)>.data`` so that identical documents are stored once.
+Missing documents (e.g. a 404 response) are recorded in
+``<sha256(url)>.missing`` and not requested again for *negative_ttl* seconds.
+
+:class:`RenderCache` stores the parsed documentation (pickled doctrees)
+keyed by a hash of the documentation and of the parser settings, with a
+least recently used eviction.
+
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # no inter-process locking on Windows
+    fcntl = None
+
+
+def atomic_write(filename, data):
+    """Write *data* (bytes) in a file so that readers never see a partial file"""
+    # write in a temporary file first, then rename it
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename))
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+    os.replace(tmpname, filename)
+
+
+def sha256(data):
+    """Return the hexadecimal SHA-256 digest of a str or bytes"""
+    if isinstance(data, str):
+        data = data.encode("utf8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class FetchCache:
+    """Persistent store of fetched documents keyed by URL
+
+    ::
+
+        cache = FetchCache("/tmp/cache", ttl=3600)
+        cache.set(url, b"content", etag='"abc"')
+        entry = cache.get(url)
+        if cache.is_fresh(entry):
+            data = cache.read(entry)
+
+    :param directory: where to store the cache files. Created if needed.
+    :param ttl: time (in seconds) during which an entry is considered valid
+        without revalidation against the remote server.
+    :param negative_ttl: time (in seconds) during which a missing document is
+        not requested again.
+    """
+
+    def __init__(self, directory, ttl=86400, negative_ttl=3600):
+        self.directory = directory
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, filename, data):
+        atomic_write(filename, data)
+
+    def get(self, url):
+        """Return the metadata stored for *url* or None"""
+        try:
+            with open(self._path(sha256(url) + ".json"), "r") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._path(entry["sha256"] + ".data")):
+            return None
+        return entry
+
+    def read(self, entry):
+        """Return the content (bytes) of a cache entry"""
+        with open(self._path(entry["sha256"] + ".data"), "rb") as fh:
+            return fh.read()
+
+    def set(self, url, content, etag=None, last_modified=None):
+        """Store *content* (bytes) for *url* and return the new entry"""
+        digest = sha256(content)
+        datafile = self._path(digest + ".data")
+        if not os.path.exists(datafile):
+            self._write(datafile, content)
+        entry = {
+            "url": url,
+            "sha256": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "checked": time.time(),
+        }
+        self._write(self._path(sha256(url) + ".json"), json.dumps(entry).encode("utf8"))
+        with contextlib.suppress(OSError):
+            os.remove(self._path(sha256(url) + ".missing"))
+        return entry
+
+    def get_missing(self, url):
+        """Return the HTTP status of *url* if recorded as missing recently
+
+        Returns None if *url* is not recorded as missing or if the record is
+        older than *negative_ttl* seconds.
+        """
+        try:
+            with open(self._path(sha256(url) + ".missing"), "r") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["checked"] >= self.negative_ttl:
+            return None
+        return entry["status"]
+
+    def set_missing(self, url, status):
+        """Record that *url* does not exist (e.g. *status* is 404)"""
+        entry = {"url": url, "status": status, "checked": time.time()}
+        self._write(self._path(sha256(url) + ".missing"), json.dumps(entry).encode("utf8"))
+
+    def touch(self, url, entry):
+        """Mark *entry* as revalidated now (e.g. after a 304 response)"""
+        entry = dict(entry, checked=time.time())
+        self._write(self._path(sha256(url) + ".json"), json.dumps(entry).encode("utf8"))
+        return entry
+
+    def is_fresh(self, entry):
+        """Return True if *entry* was validated less than *ttl* seconds ago"""
+        return time.time() - entry["checked"] < self.ttl
+
+    @contextlib.contextmanager
+    def lock(self, url):
+        """Exclusive lock on *url* shared by all processes using this cache
+
+        Used so that only one process downloads a document while the others
+        wait and then read it from the cache.
+        """
+        if fcntl is None:  # pragma: no cover
+            yield
+            return
+        with open(self._path(sha256(url) + ".lock"), "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def validators(self, entry):
+        """Return the HTTP headers used to revalidate *entry*"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+class RenderCache:
+    """Persistent store of rendered (pickled) documentation keyed by hash
+
+    ::
+
+        cache = RenderCache("/tmp/render", max_size=50 * 1024 * 1024)
+        key = sha256(docstring)
+        data = cache.get(key)
+        if data is None:
+            cache.set(key, pickle.dumps(node))
+
+    Entries read during the build are also kept in memory. When the total
+    size of the entries exceeds *max_size*, the least recently used entries
+    are removed.
+
+    :param directory: where to store the entries. Created if needed.
+    :param max_size: maximum size in bytes of the stored entries
+    """
+
+    def __init__(self, directory, max_size=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self._memory = {}
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def _entries(self):
+        # (last use, size, path) of the stored entries
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pickle"):
+                with contextlib.suppress(OSError):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(self.directory, name)))
+        return entries
+
+    def get(self, key):
+        """Return the data (bytes) stored for *key* or None"""
+        if key not in self._memory:
+            try:
+                with open(self._path(key), "rb") as fh:
+                    self._memory[key] = fh.read()
+                # the modification time records the last use
+                os.utime(self._path(key))
+            except OSError:
+                return None
+        return self._memory[key]
+
+    def set(self, key, data):
+        """Store *data* (bytes) for *key* and evict old entries if needed"""
+        self._memory[key] = data
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        atomic_write(self._path(key), data)
+        self._size += len(data)
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries above *max_size*"""
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+                self._size -= size
@@ -0,0 +1,392 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Engine shared by the sequana directives
+
+Each kind of documentation (wrapper, pipeline, rule) is declared once as a
+:class:`SourceKind` registered with :func:`register_kind`::
+
+    KIND = register_kind(
+        SourceKind(
+            "pipeline",
+            directive="sequana_pipeline",
+            node=sequana_pipeline_rule,
+            get_doc=get_rule_doc,
+            get_urls=lambda name: [get_url(name)],
+        )
+    )
+
+    def setup(app):
+        return setup_kind(app, KIND)
+
+The engine then provides the directive (fetch, parse and render of the
+documentation), the node visitors of all builders, the prefetch of the
+documents, the metrics and the incremental build support, identically for
+every kind.
+
+A directive may document several targets, separated by spaces, commas or new
+lines, and glob patterns if the kind can list its targets::
+
+    .. snakemakerule:: dag fastqc
+        bowtie2_*
+
+The documents of all targets are then fetched at once (each distinct
+document once) before the targets are rendered, each under a rubric, in a
+single container.
+
+The parsed documentation is stored in a persistent cache (see
+:class:`~sequana_sphinxext.cache.RenderCache`) in the cache directory, keyed
+by a hash of the documentation, of the node class and of the docutils and
+Sphinx versions, so that identical documentation is parsed once across pages
+and builds. The following options can be set in the conf.py file:
+
+- **sequana_sphinxext_render_cache**: set to False to disable the cache
+- **sequana_sphinxext_render_cache_size**: maximum size of the cache in bytes
+  (defaults to 50 MiB); the least recently used entries are removed first.
+
+"""
+import fnmatch
+import os
+import pickle
+
+import docutils
+import sphinx
+from docutils import nodes
+from sphinx import addnodes
+from docutils.nodes import Body, Element
+from docutils.statemachine import StringList
+from sphinx.util.docutils import SphinxDirective
+from sphinx.util.nodes import nested_parse_with_titles
+
+from sequana_sphinxext import metrics
+from sequana_sphinxext.cache import RenderCache, sha256
+from sequana_sphinxext.fetch import (
+    FetchError,
+    get_cache_dir,
+    is_pattern,
+    note_target,
+    prefetch,
+    register_prefetch,
+    split_targets,
+)
+
+
+class sequana_node(Body, Element):
+    """Base class of the nodes holding the documentation of a target
+
+    The documentation is parsed at read time into standard docutils nodes
+    (the children) that every builder renders natively.
+    """
+
+
+class SourceKind:
+    """Declaration of a kind of sequana documentation
+
+    :param name: name of the kind (e.g. wrapper)
+    :param directive: name of the directive (e.g. sequana_wrapper)
+    :param node: the node class (a :class:`sequana_node` subclass) holding
+        the documentation
+    :param get_doc: function returning the reST documentation of a target.
+        It is called with the target name and the options of the directive
+        as keyword arguments.
+    :param get_urls: function returning the URLs of the documents required by
+        a target (prefetched before reading the sources and used to detect
+        upstream changes)
+    :param option_spec: the options of the directive
+    :param css_class: class of the HTML div wrapping the documentation
+    :param list_targets: function returning the names of the available
+        targets, used to expand glob patterns (patterns are not supported if
+        not provided)
+    """
+
+    def __init__(
+        self, name, directive, node, get_doc, get_urls=None, option_spec=None, css_class=None, list_targets=None
+    ):
+        self.name = name
+        self.directive = directive
+        self.node = node
+        self.get_doc = get_doc
+        self.get_urls = get_urls
+        self.option_spec = option_spec or {}
+        self.css_class = css_class or directive
+        self.list_targets = list_targets
+
+    def __repr__(self):
+        return f"SourceKind({self.name!r}, directive={self.directive!r})"
+
+
+# kind name -> SourceKind
+_kinds = {}
+# cache of the parsed documentation (None if disabled)
+_render_cache = None
+
+
+def register_kind(kind):
+    """Register a :class:`SourceKind` and return it"""
+    _kinds[kind.name] = kind
+    return kind
+
+
+def get_kinds():
+    """Return the registered kinds (name -> :class:`SourceKind`)"""
+    return dict(_kinds)
+
+
+def get_kind(directive):
+    """Return the :class:`SourceKind` of a directive or None"""
+    return next((kind for kind in _kinds.values() if kind.directive == directive), None)
+
+
+def configure(cache_dir=None, max_size=50 * 1024 * 1024):
+    """Set the directory of the render cache (None to disable the cache)"""
+    global _render_cache
+    _render_cache = RenderCache(cache_dir, max_size=max_size) if cache_dir else None
+
+
+# nodes that register more than ids and names in the document, that are
+# bound to the page being read (cross-references and toctrees keep its
+# docname) or that report parsing errors; documentation containing them (or
+# anonymous references and targets, see _is_uncached) is not cached
+_UNCACHED = (
+    addnodes.pending_xref,
+    addnodes.download_reference,
+    addnodes.toctree,
+    nodes.system_message,
+    nodes.pending,
+    nodes.footnote,
+    nodes.footnote_reference,
+    nodes.citation,
+    nodes.citation_reference,
+    nodes.substitution_definition,
+    nodes.substitution_reference,
+)
+
+
+def _is_uncached(node):
+    return isinstance(node, _UNCACHED) or (isinstance(node, nodes.Element) and node.get("anonymous"))
+
+
+def _register(document, node):
+    # register the ids and names of a cached doctree in the new document;
+    # the ids are generated again so that they are unique in the document
+    for element in node.findall(nodes.Element, include_self=False):
+        if element.get("refname"):
+            document.note_refname(element)
+        if element["ids"] or element["names"]:
+            element["ids"] = []
+            if isinstance(element, nodes.section):
+                document.note_implicit_target(element)
+            else:
+                document.note_explicit_target(element)
+
+
+# configuration values that change the parsing of the documentation
+_RENDER_CONFIG = ("extensions", "default_role", "primary_domain", "highlight_language", "language")
+
+
+def _render_key(kind, name, docstring, settings):
+    env = getattr(settings, "env", None)
+    config = [repr(getattr(env.config, x, None)) for x in _RENDER_CONFIG] if env else []
+    return sha256(
+        "\0".join(
+            [
+                docutils.__version__,
+                sphinx.__version__,
+                f"{kind.node.__module__}.{kind.node.__name__}",
+                kind.css_class,
+                name,
+                str(settings.tab_width),
+                str(settings.language_code),
+            ]
+            + config
+            + [docstring]
+        )
+    )
+
+
+def parse(kind, name, docstring, state):
+    """Parse the reST documentation of a target into a new node
+
+    The parsed documentation is read from the render cache if available.
+    """
+    key = _render_key(kind, name, docstring, state.document.settings) if _render_cache else None
+    data = _render_cache.get(key) if key else None
+    if data is not None:
+        node = pickle.loads(data)
+        _register(state.document, node)
+        return node
+
+    node = kind.node("", classes=[kind.css_class])
+    with metrics.phase("parse"):
+        nested_parse_with_titles(state, StringList(docstring.splitlines(), source=name), node)
+    if key and not any(True for _ in node.findall(_is_uncached)):
+        _render_cache.set(key, pickle.dumps(node))
+    return node
+
+
+def render(kind, name, state, options=None):
+    """Fetch and parse the documentation of a target
+
+    :return: the list of nodes inserted in the document
+    """
+    try:
+        with metrics.phase("fetch"):
+            docstring = kind.get_doc(name, **(options or {}))
+    except Exception:
+        docstring = f"Could not read or interpret documentation for {name}"
+    return [parse(kind, name, docstring, state)]
+
+
+def expand_targets(kind, targets):
+    """Expand the glob patterns of a list of targets
+
+    :return: the names (in order, without duplicates) and the patterns that
+        matched no target
+    """
+    names, unmatched = [], []
+    available = None
+    for target in targets:
+        if is_pattern(target):
+            if available is None:
+                available = sorted(kind.list_targets()) if kind.list_targets else []
+            matches = fnmatch.filter(available, target)
+            if not matches:
+                unmatched.append(target)
+            names += matches
+        else:
+            names.append(target)
+    return list(dict.fromkeys(names)), unmatched
+
+
+def render_many(kind, names, state, options=None, workers=8):
+    """Fetch and parse the documentation of several targets
+
+    The documents of all targets are prefetched at once (see
+    :func:`~sequana_sphinxext.fetch.prefetch`); each distinct document is
+    fetched once.
+
+    :return: a container with a rubric and the documentation of each target
+    """
+    if kind.get_urls:
+        with metrics.phase("fetch"):
+            prefetch([url for name in names for url in kind.get_urls(name)], workers=max(workers, 1))
+
+    container = nodes.container(classes=[f"{kind.css_class}_list"])
+    for name in names:
+        container += nodes.rubric(text=name)
+        container += render(kind, name, state, options)
+    return container
+
+
+class SequanaDirective(SphinxDirective):
+    """Directive inserting the documentation of the targets (the content)
+
+    Subclasses are created for each kind by :func:`make_directive`.
+    """
+
+    has_content = True
+    kind = None
+
+    def run(self):
+        targets = split_targets(self.content)
+        if not targets:
+            return [self.state.document.reporter.error(f"{self.name}: no target given", line=self.lineno)]
+        with metrics.directive(self.env, self.name, " ".join(targets)):
+            try:
+                names, unmatched = expand_targets(self.kind, targets)
+            except FetchError as err:
+                # the available targets could not be listed
+                return [self.state.document.reporter.warning(str(err), line=self.lineno)]
+            if len(names) == 1 and names == targets:
+                result = render(self.kind, names[0], self.state, self.options)
+            else:
+                workers = self.config.sequana_sphinxext_prefetch_workers
+                result = [render_many(self.kind, names, self.state, self.options, workers)]
+        reporter = self.state.document.reporter
+        for pattern in unmatched:
+            result.append(reporter.warning(f"No {self.kind.name} matches {pattern}", line=self.lineno))
+        for name in names:
+            note_target(self.env, self.name, name)
+        return result
+
+
+def make_directive(kind):
+    """Return the directive class of a :class:`SourceKind`"""
+    attributes = {"kind": kind, "option_spec": kind.option_spec}
+    return type(f"{kind.name.capitalize()}Directive", (SequanaDirective,), attributes)
+
+
+def visit_html(self, node):
+    self.body.append(self.starttag(node, "div"))
+
+
+def depart_html(self, node):
+    self.body.append("</div>\n")
+
+
+def visit_passthrough(self, node):
+    pass
+
+
+def depart_passthrough(self, node):
+    pass
+
+
+def setup_kind(app, kind, directive=None):
+    """Register the directive, the node and the prefetch of a kind
+
+    The HTML translator (also used by the singlehtml, dirhtml and epub
+    builders) wraps the documentation in a div; the other translators simply
+    render the children.
+
+    :param directive: the directive class (see :func:`make_directive`)
+    :return: the extension metadata
+    """
+    app.setup_extension("sequana_sphinxext.engine")
+    app.setup_extension("sequana_sphinxext.modules")
+    app.add_directive(kind.directive, directive or make_directive(kind))
+    app.add_node(
+        kind.node,
+        html=(visit_html, depart_html),
+        latex=(visit_passthrough, depart_passthrough),
+        text=(visit_passthrough, depart_passthrough),
+        man=(visit_passthrough, depart_passthrough),
+        texinfo=(visit_passthrough, depart_passthrough),
+    )
+    if kind.get_urls:
+        register_prefetch(kind.directive, kind.get_urls)
+
+    return {
+        "version": "1.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
+
+
+def _builder_inited(app):
+    if app.config.sequana_sphinxext_render_cache:
+        configure(os.path.join(get_cache_dir(app), "render"), app.config.sequana_sphinxext_render_cache_size)
+    else:
+        configure(None)
+
+
+def setup(app):
+    app.setup_extension("sequana_sphinxext.fetch")
+    app.add_config_value("sequana_sphinxext_render_cache", True, "env")
+    app.add_config_value("sequana_sphinxext_render_cache_size", 50 * 1024 * 1024, "")
+    app.connect("builder-inited", _builder_inited)
+
+    return {
+        "version": "1.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
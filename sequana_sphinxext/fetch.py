@@ -0,0 +1,915 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Fetch layer shared by the sequana sphinx extensions
+
+All remote documents (wrapper READMEs, pipeline READMEs, rules) are retrieved
+through :func:`fetch`. When used within Sphinx, documents are stored in an
+on-disk cache (see :class:`~sequana_sphinxext.cache.FetchCache`) located in the
+doctree directory. The following options can be set in the **conf.py** file:
+
+- **sequana_sphinxext_cache_dir**: where to store the cache (defaults to
+  <doctreedir>/sequana_sphinxext)
+- **sequana_sphinxext_cache_ttl**: time in seconds during which a cached
+  document is used without revalidation (defaults to one day)
+- **sequana_sphinxext_fetch_mode**: *online* (default), *offline* or
+  *stale-while-revalidate*. In *offline* mode, the network is never accessed
+  and only the cached documents (and local sources) are used. In
+  *stale-while-revalidate* mode, stale cached documents are used immediately
+  and revalidated in the background; the cache is updated for the next build.
+- **sequana_sphinxext_cache_only**: if True, same as the *offline* mode.
+- **sequana_sphinxext_refresh_wait**: time in seconds the end of the build
+  waits for the background revalidations (defaults to 5 seconds; 0 to not
+  wait). Pending revalidations are abandoned after this delay.
+- **sequana_sphinxext_prefetch_workers**: number of concurrent downloads used
+  to prefetch the documents before reading the sources (0 to disable).
+- **sequana_sphinxext_fetch_backend**: *threads* (default) or *asyncio* to
+  prefetch the documents with coroutines on a background event loop (see
+  :mod:`sequana_sphinxext.aio`).
+- **sequana_sphinxext_timeout**: (connect, read) timeouts in seconds.
+- **sequana_sphinxext_retries**: number of retries (with exponential backoff)
+  on connection errors and 429/5xx responses.
+- **sequana_sphinxext_pool_size**: maximum number of connections per host.
+- **sequana_sphinxext_max_bytes**: maximum size of a downloaded document
+  (defaults to 20 MiB; None to disable). Larger documents are not read.
+- **sequana_sphinxext_negative_ttl**: time in seconds during which a missing
+  document (404) is not requested again (defaults to one hour).
+- **sequana_sphinxext_max_failures**: number of consecutive failures
+  (connection errors, timeouts, 5xx) after which a host is no longer accessed
+  for the rest of the build (0 to disable). Cached documents are used instead.
+- **sequana_sphinxext_sources**: list of (kind, location) tried in order to
+  read the documents (the next source is tried if a source does not have the
+  document or fails, e.g. an unreachable mirror). Kinds are *filesystem* (a directory with local checkouts
+  of the sequana repositories), *archive* (a zip file with the same layout)
+  and *http* (location is a mirror of https://raw.githubusercontent.com/sequana
+  or None for GitHub itself). Defaults to ``[("http", None)]``. See
+  :mod:`sequana_sphinxext.sources`.
+- **sequana_sphinxext_bundle**: a bundle created with ``python -m
+  sequana_sphinxext snapshot`` (see :mod:`sequana_sphinxext.snapshot`), tried
+  before the other sources.
+
+All requests go through a single :class:`requests.Session` so that
+connections are kept alive and reused between documents. Each process has its
+own session: the parallel readers forked by Sphinx open their own connections.
+
+Concurrent fetches of the same URL are coalesced: within a process, only the
+first caller downloads the document and the others wait for its result; across
+processes (e.g. sphinx-build -j N) sharing the same cache, a file lock makes
+the other workers wait and read the document from the cache.
+
+Before the sources are read, the documents referenced by the sequana
+directives are all fetched at once (see :func:`prefetch`) so that directives
+read them from memory. Fetched documents are stored once per build, keyed by
+the hash of their content (see :func:`intern_document`); as the prefetch runs
+before the parallel readers are forked, they share this store.
+
+The targets used by each document are recorded in the build environment (see
+:func:`note_target`) and merged back from the parallel readers, together with
+a hash of the fetched documents. On the next build, the documents are
+revalidated and only the pages whose upstream content changed are re-read.
+
+This extension is loaded automatically by the other sequana extensions.
+
+"""
+import collections
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from sphinx.util import logging
+
+from sequana_sphinxext import metrics
+from sequana_sphinxext.cache import FetchCache, sha256
+from sequana_sphinxext.sources import GITHUB_URL, ArchiveProvider, FileSystemProvider, SnapshotProvider
+
+
+logger = logging.getLogger(__name__)
+
+
+# default maximum size of a downloaded document
+MAX_BYTES = 20 * 1024 * 1024
+
+# kinds of sources (see get_provider)
+SOURCE_KINDS = ("filesystem", "archive", "snapshot", "http")
+# fetch modes
+FETCH_MODES = ("online", "offline", "stale-while-revalidate")
+
+_cache = None
+_mode = "online"
+# prefetch engine: threads or asyncio
+_backend = "threads"
+_http = {"timeout": (5, 30), "retries": 3, "pool_size": 8, "max_bytes": MAX_BYTES, "max_failures": 5}
+_session = None
+_session_lock = threading.Lock()
+# documents already fetched during this build (url -> key in _documents)
+_memory = {}
+# content of the fetched documents, stored once (sha256 -> text)
+_documents = {}
+# documents that could not be fetched during this build (url -> FetchError)
+_errors = {}
+# consecutive failures per host (circuit breaker)
+_failures = {}
+_failures_lock = threading.Lock()
+# documents being fetched (url -> Future) shared by concurrent callers
+_inflight = {}
+_inflight_lock = threading.Lock()
+# sources of the documents, in priority order
+_providers = []
+# stale documents revalidated in the background: URLs queued during this
+# build, tasks waiting, number of tasks not done and of worker threads
+_refreshed = set()
+_refresh_queue = collections.deque()
+_refresh_pending = 0
+_refresh_workers = 0
+_refresh_lock = threading.Condition()
+# directive name -> function returning the URLs required by a target name
+_prefetchers = {}
+# url -> function reading the streamed response (see register_reader)
+_readers = {}
+
+
+def _reset():
+    # a forked process (e.g. a parallel reader of Sphinx) must not share the
+    # connections of its parent, nor wait for its fetches and background
+    # revalidations; locks are created again as they may be held at fork time
+    global _session, _session_lock, _inflight_lock, _failures_lock
+    global _refresh_lock, _refresh_pending, _refresh_workers
+    _session = None
+    _session_lock = threading.Lock()
+    _inflight.clear()
+    _inflight_lock = threading.Lock()
+    _failures_lock = threading.Lock()
+    _refresh_queue.clear()
+    _refresh_pending = 0
+    _refresh_workers = 0
+    _refresh_lock = threading.Condition()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+class FetchError(Exception):
+    """Raised when a document cannot be retrieved"""
+
+    def __init__(self, url, reason, status=None):
+        super().__init__(f"Could not access to {url} ({reason})")
+        self.url = url
+        self.status = status
+
+
+def configure(
+    cache_dir=None,
+    ttl=86400,
+    cache_only=False,
+    timeout=(5, 30),
+    retries=3,
+    pool_size=8,
+    sources=None,
+    max_bytes=MAX_BYTES,
+    negative_ttl=3600,
+    max_failures=5,
+    backend="threads",
+    mode="online",
+):
+    """Set the cache, HTTP options and sources used by :func:`fetch`
+
+    :param cache_dir: directory of the on-disk cache. If None, the cache is
+        disabled and every call to :func:`fetch` accesses the network.
+    :param ttl: see :class:`~sequana_sphinxext.cache.FetchCache`
+    :param cache_only: only use the cached documents (same as the offline
+        mode)
+    :param timeout: (connect, read) timeouts in seconds
+    :param retries: number of retries on connection errors and 429/5xx
+    :param pool_size: maximum number of connections per host
+    :param sources: list of (kind, location) tried in order (see
+        :func:`get_provider`). Defaults to GitHub only. Sources that cannot
+        be read (e.g. a missing directory or a corrupted archive) are skipped
+        with a warning.
+    :param max_bytes: maximum size of a downloaded document (None for no
+        limit)
+    :param negative_ttl: see :class:`~sequana_sphinxext.cache.FetchCache`
+    :param max_failures: number of consecutive failures after which a host
+        is no longer accessed (0 to disable)
+    :param backend: the prefetch engine, *threads* or *asyncio*
+    :param mode: *online*, *offline* (only use the cached documents) or
+        *stale-while-revalidate* (use the stale cached documents and
+        revalidate them in the background)
+    """
+    global _cache, _mode, _session, _backend
+    if backend not in ("threads", "asyncio"):
+        raise ValueError(f"Unknown fetch backend {backend}; use threads or asyncio")
+    if mode not in FETCH_MODES:
+        raise ValueError(f"Unknown fetch mode {mode}; use {', '.join(FETCH_MODES)}")
+    _backend = backend
+    _cache = FetchCache(cache_dir, ttl=ttl, negative_ttl=negative_ttl) if cache_dir else None
+    _mode = "offline" if cache_only else mode
+    _memory.clear()
+    _documents.clear()
+    _errors.clear()
+    _failures.clear()
+    _refreshed.clear()
+
+    _http.update(
+        timeout=tuple(timeout), retries=retries, pool_size=pool_size, max_bytes=max_bytes, max_failures=max_failures
+    )
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+    _providers[:] = []
+    for kind, location in sources or [("http", None)]:
+        if kind not in SOURCE_KINDS:
+            raise ValueError(f"Unknown source kind {kind}; use {', '.join(SOURCE_KINDS)}")
+        try:
+            _providers.append(get_provider(kind, location))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as err:
+            # the other sources are used instead (see _get)
+            logger.warning(f"sequana_sphinxext: the {kind} source {location} cannot be read and is skipped ({err})")
+
+
+def get_provider(kind, location=None):
+    """Return the source of documents of a given kind
+
+    :param kind: one of *filesystem*, *archive*, *snapshot* or *http*
+    :param location: the directory (filesystem), the zip file (archive), the
+        bundle (snapshot) or the base URL replacing
+        https://raw.githubusercontent.com/sequana (http)
+    """
+    if kind == "filesystem":
+        return FileSystemProvider(location)
+    elif kind == "archive":
+        return ArchiveProvider(location)
+    elif kind == "snapshot":
+        return SnapshotProvider(location)
+    elif kind == "http":
+        return HTTPProvider(location)
+    raise ValueError(f"Unknown source kind {kind}; use {', '.join(SOURCE_KINDS)}")
+
+
+def get_snapshot_versions():
+    """Return the pipeline versions recorded in the snapshot sources
+
+    If several bundles are used, the first one wins.
+    """
+    versions = {}
+    for provider in reversed(_providers):
+        if isinstance(provider, SnapshotProvider):
+            versions.update(provider.versions)
+    return versions
+
+
+def get_checkout(repo):
+    """Return the path of a local checkout of a sequana repository or None"""
+    for provider in _providers:
+        path = provider.get_checkout(repo)
+        if path:
+            return path
+
+
+def get_session():
+    """Return the HTTP session shared by all fetches (created on first use)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=_http["retries"],
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                raise_on_status=False,
+            )
+            # pool_block limits the number of connections opened per host
+            adapter = HTTPAdapter(
+                pool_connections=_http["pool_size"],
+                pool_maxsize=_http["pool_size"],
+                pool_block=True,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def fetch(url, read=None):
+    """Return the content of *url* as a string
+
+    Fresh cached documents are returned without any network access. Stale ones
+    are revalidated with a conditional request. If the network is not reachable
+    the stale document is used. In the *stale-while-revalidate* mode (see
+    :func:`configure`), stale documents are returned at once and revalidated
+    in the background for the next build; in the *offline* mode, the network
+    is never accessed.
+
+    Documents are kept in memory for the rest of the build, and so are the
+    failures: a document that could not be fetched is not requested again
+    during the build. Missing documents (404) are also recorded in the cache
+    and not requested again for some time. After several consecutive failures
+    on a host (see :func:`configure`), the host is no longer accessed and
+    only cached documents are used. Concurrent calls for the same URL share a
+    single fetch and, across processes using the same cache, only one process
+    downloads a document while the others wait for it.
+
+    Downloads are streamed and aborted as soon as the document exceeds the
+    maximum size set with :func:`configure`.
+
+    :param read: optional function called with the streamed response (see
+        :class:`requests.Response`) that returns the bytes to store instead
+        of the whole content (e.g. a few members of an archive). The maximum
+        size applies to the returned bytes.
+    :raises FetchError: if the document is not available or too large.
+    """
+    read = read or _readers.get(url)
+    future, owner = _claim(url)
+    if owner:
+        try:
+            content = _get(url, read)
+        except Exception as err:
+            _settle(url, future, error=err)
+        else:
+            _settle(url, future, content)
+    return future.result()
+
+
+def _claim(url):
+    # return (future, owner). The owner fetches the document and settles the
+    # future (see _settle); the other callers wait for the future. Documents
+    # already fetched (or failed) during the build are returned as resolved
+    # futures.
+    future = Future()
+    if url in _memory:
+        metrics.record_fetch(url, "memory")
+        future.set_result(_documents[_memory[url]])
+        return future, False
+    if url in _errors:
+        metrics.record_fetch(url, "error")
+        future.set_exception(_errors[url])
+        return future, False
+
+    with _inflight_lock:
+        if url in _inflight:
+            # another thread is fetching this document
+            metrics.record_fetch(url, "memory")
+            return _inflight[url], False
+        _inflight[url] = future
+    return future, True
+
+
+def _settle(url, future, content=None, error=None):
+    # store the content (bytes) or the error of the fetch owning *future*
+    try:
+        if error is None:
+            key = intern_document(content.decode("utf8"))
+            _memory[url] = key
+            future.set_result(_documents[key])
+        else:
+            if isinstance(error, FetchError):
+                metrics.record_fetch(url, "error")
+                _errors[url] = error
+            future.set_exception(error)
+    except Exception as err:  # pragma: no cover
+        # e.g. a document that is not UTF-8
+        future.set_exception(err)
+    finally:
+        with _inflight_lock:
+            del _inflight[url]
+
+
+def intern_document(text):
+    """Store a document once in the build and return its key (SHA-256)
+
+    Identical documents (e.g. the same README read from several URLs or
+    sources) share a single string.
+    """
+    key = sys.intern(sha256(text))
+    _documents.setdefault(key, text)
+    return key
+
+
+def get_key(url):
+    """Return the key of a document fetched during the build or None"""
+    return _memory.get(url)
+
+
+def get_document(key):
+    """Return the content of a document from its key (see :func:`get_key`)"""
+    return _documents[key]
+
+
+def get_documents():
+    """Return the documents fetched during the build (url -> text)"""
+    return {url: _documents[key] for url, key in _memory.items()}
+
+
+def get_errors():
+    """Return the documents that could not be fetched during the build
+    (url -> :class:`FetchError`)"""
+    return dict(_errors)
+
+
+def _get(url, read):
+    # GitHub only unless configure() was called. A source that fails (e.g.
+    # an unreachable mirror) falls back to the next one; the last error is
+    # raised if no source has the document.
+    error = None
+    for provider in _providers or [HTTPProvider()]:
+        start = time.perf_counter()
+        try:
+            content = provider.get(url, read)
+        except FetchError as err:
+            error = err
+            continue
+        if content is not None:
+            if not isinstance(provider, HTTPProvider):
+                metrics.record_fetch(url, "local", len(content), time.perf_counter() - start)
+            return content
+    raise error or FetchError(url, "not found in the configured sources")
+
+
+class HTTPProvider:
+    """Download the documents (through the on-disk cache)
+
+    :param base_url: a mirror of https://raw.githubusercontent.com/sequana. If
+        None, documents are downloaded from GitHub.
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def __repr__(self):
+        return f"HTTPProvider({self.base_url!r})"
+
+    def get_checkout(self, repo):
+        return None
+
+    def resolve(self, url):
+        """Return the URL actually downloaded for *url* (e.g. on a mirror)"""
+        if self.base_url and url.startswith(GITHUB_URL + "/"):
+            return self.base_url + url[len(GITHUB_URL) :]
+        return url
+
+    def get(self, url, read=None):
+        return _fetch(self.resolve(url), read)
+
+
+def _fetch(url, read):
+    start = time.perf_counter()
+    entry = _cache.get(url) if _cache else None
+    content = _cached(url, entry, start, read)
+    if content is not None:
+        return content
+
+    if _cache is None:
+        return _download(url, read, entry, start)
+
+    requested = time.time()
+    with _cache.lock(url):
+        # another process may have downloaded or revalidated the document
+        # while we were waiting for the lock
+        entry = _cache.get(url)
+        if entry and (_cache.is_fresh(entry) or entry["checked"] >= requested):
+            metrics.record_fetch(url, "cache", 0, time.perf_counter() - start)
+            return _cache.read(entry)
+        return _download(url, read, entry, start)
+
+
+def _cached(url, entry, start, read=None):
+    # return the cached content if it can be used without network access;
+    # None if the document must be downloaded or revalidated
+    if entry and (_mode == "offline" or _cache.is_fresh(entry)):
+        metrics.record_fetch(url, "cache", 0, time.perf_counter() - start)
+        return _cache.read(entry)
+    if _mode == "offline":
+        raise FetchError(url, "not in cache and offline mode is set")
+    if entry and _mode == "stale-while-revalidate":
+        _revalidate_later(url, read)
+        metrics.record_fetch(url, "stale", 0, time.perf_counter() - start)
+        return _cache.read(entry)
+    status = _cache.get_missing(url) if _cache else None
+    if status:
+        raise FetchError(url, f"HTTP {status}, cached", status=status)
+    return None
+
+
+def _revalidate_later(url, read):
+    # queue a stale document for revalidation in the background (once per
+    # build); threads are started on demand, up to the pool size
+    global _refresh_pending, _refresh_workers
+    with _refresh_lock:
+        if url in _refreshed:
+            return
+        _refreshed.add(url)
+        _refresh_queue.append((_cache, url, read))
+        _refresh_pending += 1
+        _refresh_lock.notify()
+        if _refresh_workers < min(len(_refresh_queue), _http["pool_size"]):
+            _refresh_workers += 1
+            threading.Thread(target=_refresh_worker, name="sequana_sphinxext_refresh", daemon=True).start()
+
+
+def _refresh_worker():
+    global _refresh_pending, _refresh_workers
+    while True:
+        with _refresh_lock:
+            # exit when idle so that no thread is left between builds
+            if not _refresh_lock.wait_for(lambda: _refresh_queue, timeout=1):
+                _refresh_workers -= 1
+                return
+            cache, url, read = _refresh_queue.popleft()
+        try:
+            _refresh(cache, url, read)
+        except Exception as err:
+            logger.debug(f"sequana_sphinxext: could not revalidate {url} ({err})")
+        finally:
+            with _refresh_lock:
+                _refresh_pending -= 1
+                _refresh_lock.notify_all()
+
+
+def _refresh(cache, url, read):
+    # revalidate a stale document and update the cache. Unlike _download,
+    # failures are not reported: the stale document was already used.
+    with cache.lock(url):
+        entry = cache.get(url)
+        if entry is None or cache.is_fresh(entry):
+            return
+        host = urlsplit(url).netloc
+        if _http["max_failures"] and _failures.get(host, 0) >= _http["max_failures"]:
+            return
+        r = get_session().get(url, headers=cache.validators(entry), timeout=_http["timeout"], stream=True)
+        with r:
+            if r.status_code == 304:
+                cache.touch(url, entry)
+            elif r.status_code == 200:
+                content = read(r) if read else _read_content(url, r)
+                _check_size(url, len(content))
+                cache.set(url, content, etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+
+
+def wait_refresh(timeout=None):
+    """Wait for the background revalidations (stale-while-revalidate mode)
+
+    :return: True if all revalidations are done, False on timeout
+    """
+    with _refresh_lock:
+        return _refresh_lock.wait_for(lambda: not _refresh_pending, timeout=timeout)
+
+
+def _failed(host, failed):
+    # update the consecutive failures of a host; return True if the host
+    # has just been disabled
+    with _failures_lock:
+        _failures[host] = _failures.get(host, 0) + 1 if failed else 0
+        return failed and _failures[host] == _http["max_failures"]
+
+
+def _check_host(url, entry, start):
+    # circuit breaker: return the stale content (or raise) if the host was
+    # disabled after too many failures; None if the host can be accessed
+    host = urlsplit(url).netloc
+    if _http["max_failures"] and _failures.get(host, 0) >= _http["max_failures"]:
+        if entry:
+            metrics.record_fetch(url, "cache", 0, time.perf_counter() - start)
+            return _cache.read(entry)
+        raise FetchError(url, f"{host} disabled after {_http['max_failures']} consecutive failures")
+    return None
+
+
+def _network_error(url, entry, err, start):
+    # connection error or timeout: use the stale content if any
+    host = urlsplit(url).netloc
+    if _failed(host, True):
+        logger.warning(f"{host} is not reachable; using cached documents only for the rest of the build")
+    if entry:
+        logger.warning(f"Could not revalidate {url}; using cached version ({err})")
+        metrics.record_fetch(url, "cache", 0, time.perf_counter() - start)
+        return _cache.read(entry)
+    raise FetchError(url, err)
+
+
+def _check_response(url, entry, status, start):
+    # return the cached content if revalidated (304); raise if the document
+    # is not available; None if the content of the response must be read
+    host = urlsplit(url).netloc
+    if _failed(host, status >= 500):
+        logger.warning(f"{host} keeps failing; using cached documents only for the rest of the build")
+    if status == 304 and entry:
+        _cache.touch(url, entry)
+        metrics.record_fetch(url, "revalidated", 0, time.perf_counter() - start)
+        return _cache.read(entry)
+    if status in (404, 410) and _cache:
+        _cache.set_missing(url, status)
+    if status != 200:
+        raise FetchError(url, f"HTTP {status}", status=status)
+    return None
+
+
+def _check_size(url, size, length=None):
+    # raise if a document (or its announced Content-Length) is too large
+    limit = _http["max_bytes"]
+    if limit and length and length.isdigit() and int(length) > limit:
+        raise FetchError(url, f"larger than {limit} bytes")
+    if limit and size > limit:
+        raise FetchError(url, f"larger than {limit} bytes")
+
+
+def _store(url, content, headers, nbytes, start):
+    metrics.record_fetch(url, "download", nbytes, time.perf_counter() - start)
+    if _cache:
+        _cache.set(url, content, etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"))
+    return content
+
+
+def _download(url, read, entry, start):
+    content = _check_host(url, entry, start)
+    if content is not None:
+        return content
+
+    headers = _cache.validators(entry) if entry else {}
+    try:
+        r = get_session().get(url, headers=headers, timeout=_http["timeout"], stream=True)
+    except requests.RequestException as err:
+        return _network_error(url, entry, err, start)
+
+    with r:
+        content = _check_response(url, entry, r.status_code, start)
+        if content is not None:
+            return content
+        content = read(r) if read else _read_content(url, r)
+        nbytes = r.raw.tell() if read else len(content)
+        _check_size(url, len(content))
+    return _store(url, content, r.headers, nbytes, start)
+
+
+def _read_content(url, response):
+    # read the streamed response chunk by chunk and stop as soon as the
+    # maximum size is exceeded
+    _check_size(url, 0, response.headers.get("Content-Length"))
+    chunks, size = [], 0
+    for chunk in response.iter_content(64 * 1024):
+        size += len(chunk)
+        _check_size(url, size)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def register_prefetch(directive, get_urls):
+    """Declare the documents required by a directive
+
+    :param directive: name of the directive (e.g. sequana_wrapper)
+    :param get_urls: function that returns the list of URLs required by the
+        target of a directive (e.g. fastqc)
+    """
+    _prefetchers[directive] = get_urls
+
+
+def register_reader(url, read):
+    """Declare the function reading the response of *url*
+
+    The function is used whenever *url* is fetched without a *read* function
+    (e.g. by :func:`prefetch` or when the documents are revalidated); see
+    :func:`fetch`.
+    """
+    _readers[url] = read
+
+
+def prefetch(urls, workers=8):
+    """Fetch concurrently all *urls* so that :func:`fetch` reads them from memory
+
+    Failures are ignored here; they are reported when the directive fetches
+    the document again.
+    """
+    if _backend == "asyncio":
+        from sequana_sphinxext import aio
+
+        # documents read with a function (e.g. archives) are fetched by the
+        # threads below
+        aio.prefetch([url for url in urls if url not in _readers], concurrency=workers)
+        urls = [url for url in urls if url in _readers]
+
+    urls = [url for url in set(urls) if url not in _memory and url not in _errors]
+    if not urls or workers < 1:
+        return
+
+    def _prefetch(url):
+        try:
+            fetch(url)
+        except FetchError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+        list(executor.map(_prefetch, urls))
+
+
+def split_targets(lines):
+    """Return the target names of the content of a directive
+
+    Names are separated by spaces, commas or new lines.
+    """
+    return [name for line in lines for name in re.split(r"[\s,]+", line) if name]
+
+
+def is_pattern(target):
+    """Return True if a target is a glob pattern (e.g. fastq*)"""
+    return any(x in target for x in "*?[")
+
+
+def scan_directives(text, directives):
+    """Return the (directive, target) pairs found in a reST source
+
+    The targets are read on the directive line and in the indented content
+    that follows (options excepted). Glob patterns are ignored.
+    """
+    names = "|".join(re.escape(x) for x in directives)
+    pattern = re.compile(rf"^([ \t]*)\.\.\s+({names})::(.*)$")
+    lines = text.splitlines()
+    found = []
+    for i, line in enumerate(lines):
+        match = pattern.match(line)
+        if match is None:
+            continue
+        indent = len(match.group(1))
+        content = [match.group(3)]
+        for other in lines[i + 1 :]:
+            if other.strip() and len(other) - len(other.lstrip()) <= indent or other.strip().startswith(".."):
+                break
+            if not other.strip().startswith(":"):
+                content.append(other)
+        found += [(match.group(2), target) for target in split_targets(content) if not is_pattern(target)]
+    return found
+
+
+# per-document data stored in the build environment
+_ENV_ATTRIBUTES = ("sequana_sphinxext_targets", "sequana_sphinxext_sources")
+
+
+def _init_env(env):
+    for attr in _ENV_ATTRIBUTES:
+        if not hasattr(env, attr):
+            setattr(env, attr, {})
+
+
+def note_target(env, directive, name):
+    """Record in the environment that the current document uses *name*
+
+    The keys (hashes) of the documents fetched for *name* are recorded as
+    well so that the page is re-read when one of them changes upstream. Keys
+    are interned: pages using the same document share the same string in the
+    environment (and in its pickle). Documents that could not be fetched are
+    recorded without a key so that the page is re-read once they are
+    available.
+    """
+    _init_env(env)
+    env.sequana_sphinxext_targets.setdefault(env.docname, set()).add((directive, name))
+
+    sources = env.sequana_sphinxext_sources.setdefault(env.docname, {})
+    for url in _prefetchers[directive](name) if directive in _prefetchers else []:
+        if url in _memory or url in _errors:
+            sources[url] = _memory.get(url)
+
+
+def _env_purge_doc(app, env, docname):
+    for attr in _ENV_ATTRIBUTES:
+        getattr(env, attr, {}).pop(docname, None)
+
+
+def _env_merge_info(app, env, docnames, other):
+    _init_env(env)
+    for attr in _ENV_ATTRIBUTES:
+        data = getattr(other, attr, {})
+        for docname in docnames:
+            if docname in data:
+                getattr(env, attr)[docname] = data[docname]
+    # keys coming from the parallel readers are interned again
+    sources = env.sequana_sphinxext_sources
+    for docname in docnames:
+        if docname in sources:
+            sources[docname] = {url: key and sys.intern(key) for url, key in sources[docname].items()}
+
+
+def _env_get_outdated(app, env, added, changed, removed):
+    sources = getattr(env, "sequana_sphinxext_sources", {})
+    urls = {url for hashes in sources.values() for url in hashes}
+    if not urls:
+        return []
+
+    # fresh cache entries cost nothing; stale ones are revalidated with a
+    # conditional request
+    prefetch(urls, workers=max(app.config.sequana_sphinxext_prefetch_workers, 1))
+
+    outdated = []
+    for docname, hashes in sources.items():
+        if docname in removed or docname in changed:
+            continue
+        for url, digest in hashes.items():
+            if _memory.get(url) != digest:
+                outdated.append(docname)
+                break
+    if outdated:
+        logger.info(f"sequana_sphinxext: {len(outdated)} document(s) changed upstream")
+    return outdated
+
+
+def _env_before_read_docs(app, env, docnames):
+    workers = app.config.sequana_sphinxext_prefetch_workers
+    if not workers or not _prefetchers:
+        return
+
+    urls = set()
+    for docname in docnames:
+        try:
+            with open(env.doc2path(docname), "r", encoding=app.config.source_encoding) as fh:
+                text = fh.read()
+        except OSError:  # pragma: no cover
+            continue
+        for directive, target in scan_directives(text, _prefetchers):
+            urls.update(_prefetchers[directive](target))
+
+    logger.info(f"sequana_sphinxext: prefetching {len(urls)} document(s)")
+    prefetch(urls, workers=workers)
+
+
+def get_cache_dir(app):
+    """Return the cache directory of a Sphinx application"""
+    return app.config.sequana_sphinxext_cache_dir or os.path.join(app.doctreedir, "sequana_sphinxext")
+
+
+def _builder_inited(app):
+    sources = list(app.config.sequana_sphinxext_sources)
+    if app.config.sequana_sphinxext_bundle:
+        sources.insert(0, ("snapshot", app.config.sequana_sphinxext_bundle))
+    cache_dir = get_cache_dir(app)
+    configure(
+        cache_dir=cache_dir,
+        ttl=app.config.sequana_sphinxext_cache_ttl,
+        cache_only=app.config.sequana_sphinxext_cache_only,
+        mode=app.config.sequana_sphinxext_fetch_mode,
+        timeout=app.config.sequana_sphinxext_timeout,
+        retries=app.config.sequana_sphinxext_retries,
+        pool_size=app.config.sequana_sphinxext_pool_size,
+        max_bytes=app.config.sequana_sphinxext_max_bytes,
+        negative_ttl=app.config.sequana_sphinxext_negative_ttl,
+        max_failures=app.config.sequana_sphinxext_max_failures,
+        backend=app.config.sequana_sphinxext_fetch_backend,
+        sources=[
+            (kind, os.path.join(app.confdir, location) if location and kind != "http" else location)
+            for kind, location in sources
+        ],
+    )
+
+
+def _build_finished(app, exception):
+    wait = app.config.sequana_sphinxext_refresh_wait
+    if _refresh_pending and wait and not wait_refresh(wait):
+        logger.info("sequana_sphinxext: background revalidation not finished; stale documents kept")
+
+
+def setup(app):
+    app.add_config_value("sequana_sphinxext_cache_dir", None, "")
+    app.add_config_value("sequana_sphinxext_cache_ttl", 86400, "")
+    app.add_config_value("sequana_sphinxext_cache_only", False, "")
+    app.add_config_value("sequana_sphinxext_fetch_mode", "online", "")
+    app.add_config_value("sequana_sphinxext_refresh_wait", 5, "")
+    app.add_config_value("sequana_sphinxext_prefetch_workers", 8, "")
+    app.add_config_value("sequana_sphinxext_fetch_backend", "threads", "")
+    app.add_config_value("sequana_sphinxext_timeout", (5, 30), "", types=(tuple, list))
+    app.add_config_value("sequana_sphinxext_retries", 3, "")
+    app.add_config_value("sequana_sphinxext_pool_size", 8, "")
+    app.add_config_value("sequana_sphinxext_max_bytes", MAX_BYTES, "", types=(int, type(None)))
+    app.add_config_value("sequana_sphinxext_negative_ttl", 3600, "")
+    app.add_config_value("sequana_sphinxext_max_failures", 5, "")
+    app.add_config_value("sequana_sphinxext_sources", [("http", None)], "env")
+    app.add_config_value("sequana_sphinxext_bundle", None, "env")
+    app.setup_extension("sequana_sphinxext.metrics")
+    app.connect("builder-inited", _builder_inited)
+    app.connect("env-before-read-docs", _env_before_read_docs)
+    app.connect("env-purge-doc", _env_purge_doc)
+    app.connect("env-merge-info", _env_merge_info)
+    app.connect("env-get-outdated", _env_get_outdated)
+    app.connect("build-finished", _build_finished)
+
+    return {
+        "version": "1.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,221 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Build-time instrumentation of the sequana extensions
+
+Set **sequana_sphinxext_profile = True** in the conf.py file to record, for
+each directive, the time spent to fetch the documentation and to parse it,
+as well as every fetched document (memory or cache hit, revalidation,
+download, local source) with the number of bytes transferred. When the build
+finishes, a summary is printed and a JSON report is written in the doctree
+directory (or in **sequana_sphinxext_profile_report** if set).
+
+Records are stored in the build environment so that the parallel readers
+report their measures as well. When profiling is off, the hooks are no-ops.
+
+"""
+import json
+import os
+import time
+
+from sphinx.util import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+_enabled = False
+# fetch events not attributed to a directive (e.g. prefetch)
+_events = []
+# the directive being measured
+_current = None
+
+
+class _Null:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def phase(self, name):
+        return self
+
+
+_NULL = _Null()
+
+
+def enable(flag=True):
+    """Turn the instrumentation on or off"""
+    global _enabled
+    _enabled = flag
+    _events.clear()
+
+
+def is_enabled():
+    return _enabled
+
+
+def record_fetch(url, status, nbytes=0, seconds=0.0):
+    """Record a fetched document
+
+    :param status: one of memory, cache, stale, revalidated, download, local,
+        error
+    """
+    if _enabled:
+        _events.append({"url": url, "status": status, "bytes": nbytes, "seconds": seconds})
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        record = self.timer.record
+        record[self.name] = record.get(self.name, 0) + time.perf_counter() - self.start
+        return False
+
+
+class DirectiveTimer:
+    """Measure a directive instance; see :func:`directive`"""
+
+    def __init__(self, env, directive, target):
+        self.env = env
+        self.record = {"docname": env.docname, "directive": directive, "target": target}
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def __enter__(self):
+        global _current
+        _current = self
+        self.start = time.perf_counter()
+        self.mark = len(_events)
+        return self
+
+    def __exit__(self, *args):
+        global _current
+        _current = None
+        self.record["total"] = time.perf_counter() - self.start
+        self.record["fetches"] = _events[self.mark :]
+        del _events[self.mark :]
+        if not hasattr(self.env, "sequana_sphinxext_metrics"):
+            self.env.sequana_sphinxext_metrics = {}
+        self.env.sequana_sphinxext_metrics.setdefault(self.env.docname, []).append(self.record)
+        return False
+
+
+def directive(env, directive, target):
+    """Context manager measuring a directive instance
+
+    ::
+
+        with metrics.directive(self.env, self.name, name):
+            with metrics.phase("fetch"):
+                ...
+    """
+    return DirectiveTimer(env, directive, target) if _enabled else _NULL
+
+
+def phase(name):
+    """Context manager measuring a phase (fetch, parse) of the current directive"""
+    return _current.phase(name) if _current is not None else _NULL
+
+
+def get_report(env):
+    """Return the records of the directives and of the other fetches"""
+    directives = [record for records in getattr(env, "sequana_sphinxext_metrics", {}).values() for record in records]
+    fetches = _events + [event for record in directives for event in record["fetches"]]
+    counts = {}
+    for event in fetches:
+        counts[event["status"]] = counts.get(event["status"], 0) + 1
+    return {
+        "directives": directives,
+        "other_fetches": list(_events),
+        "summary": {
+            "directives": len(directives),
+            "fetch": sum(x.get("fetch", 0) for x in directives),
+            "parse": sum(x.get("parse", 0) for x in directives),
+            "fetches": counts,
+            "bytes": sum(x["bytes"] for x in fetches),
+            "hit_rate": sum(counts.get(x, 0) for x in ("memory", "cache", "stale", "revalidated"))
+            / max(len(fetches), 1),
+        },
+    }
+
+
+def _env_before_read_docs(app, env, docnames):
+    # only report the directives of the current build
+    env.sequana_sphinxext_metrics = {}
+
+
+def _env_purge_doc(app, env, docname):
+    getattr(env, "sequana_sphinxext_metrics", {}).pop(docname, None)
+
+
+def _env_merge_info(app, env, docnames, other):
+    if not hasattr(env, "sequana_sphinxext_metrics"):
+        env.sequana_sphinxext_metrics = {}
+    for docname in docnames:
+        if docname in getattr(other, "sequana_sphinxext_metrics", {}):
+            env.sequana_sphinxext_metrics[docname] = other.sequana_sphinxext_metrics[docname]
+
+
+def _build_finished(app, exception):
+    if not _enabled or exception:
+        return
+
+    report = get_report(app.env)
+    filename = app.config.sequana_sphinxext_profile_report or os.path.join(
+        app.doctreedir, "sequana_sphinxext_report.json"
+    )
+    with open(filename, "w") as fh:
+        json.dump(report, fh, indent=2)
+
+    summary = report["summary"]
+    logger.info("sequana_sphinxext: slowest directives")
+    logger.info(f"{'docname':30} {'directive':25} {'target':25} {'fetch':>8} {'parse':>8} {'total':>8}")
+    for record in sorted(report["directives"], key=lambda x: -x["total"])[:20]:
+        logger.info(
+            f"{record['docname'][:30]:30} {record['directive'][:25]:25} {record['target'][:25]:25} "
+            f"{record.get('fetch', 0):8.3f} {record.get('parse', 0):8.3f} {record['total']:8.3f}"
+        )
+    logger.info(
+        f"sequana_sphinxext: {summary['directives']} directive(s), fetch {summary['fetch']:.3f}s, "
+        f"parse {summary['parse']:.3f}s, fetches {summary['fetches']}, {summary['bytes']} bytes transferred, "
+        f"hit rate {summary['hit_rate']:.0%}. Report saved in {filename}"
+    )
+
+
+def _builder_inited(app):
+    enable(app.config.sequana_sphinxext_profile)
+
+
+def setup(app):
+    app.add_config_value("sequana_sphinxext_profile", False, "")
+    app.add_config_value("sequana_sphinxext_profile_report", None, "")
+    app.connect("builder-inited", _builder_inited)
+    app.connect("env-before-read-docs", _env_before_read_docs)
+    app.connect("env-purge-doc", _env_purge_doc)
+    app.connect("env-merge-info", _env_merge_info)
+    app.connect("build-finished", _build_finished)
+
+    return {
+        "version": "1.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
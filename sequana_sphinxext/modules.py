@@ -0,0 +1,186 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Registry of the installed sequana pipelines and rules
+
+:mod:`sequana_pipetools` is imported once, on first use. The installed
+pipelines and rules are then discovered once and their paths and versions
+are memoized for the rest of the build (instead of creating a new
+:class:`sequana_pipetools.Module` per directive).
+
+The versions of the pipelines are read from the metadata of the installed
+distributions (sequana_<name>), all at once on first use;
+sequana_pipetools is only used for the pipelines not found there. When the
+documents are read from a snapshot bundle, the versions recorded in the
+bundle are used instead so that the build does not depend on the installed
+pipelines.
+
+This extension is loaded automatically by the other sequana extensions and
+resets the registry when a build starts. Set
+**sequana_sphinxext_use_pipetools = False** in the conf.py file to ignore
+sequana_pipetools and read the rules from the configured sources instead
+(see :mod:`sequana_sphinxext.fetch`).
+
+"""
+import re
+
+from sequana_sphinxext.fetch import get_snapshot_versions
+
+try:
+    from importlib import metadata
+except ImportError:  # pragma: no cover
+    # Python 3.7
+    metadata = None
+
+_pipetools = None
+_use_pipetools = True
+# name -> path of the installed pipelines and rules (None until discovered)
+_paths = None
+_versions = {}
+# pipeline name -> version of the installed sequana_<name> distributions
+_installed = None
+
+
+def get_pipetools():
+    """Return the :mod:`sequana_pipetools` module or None if not installed
+
+    The import is attempted once. Returns None as well if the use of
+    sequana_pipetools is disabled (see :func:`reset`).
+    """
+    global _pipetools
+    if not _use_pipetools:
+        return None
+    if _pipetools is None:
+        try:
+            import sequana_pipetools
+            from sequana_pipetools import Module  # noqa: F401
+
+            _pipetools = sequana_pipetools
+        except ImportError:
+            _pipetools = False
+    return _pipetools or None
+
+
+def _discover():
+    global _paths
+    if _paths is None:
+        try:
+            from sequana_pipetools.snaketools import ModuleFinder
+
+            _paths = dict(ModuleFinder()._paths)
+        except (ImportError, AttributeError):  # pragma: no cover
+            _paths = {}
+    return _paths
+
+
+def get_module_path(name):
+    """Return the path of an installed sequana rule or pipeline
+
+    :raises ImportError: if sequana_pipetools is not installed
+    :raises ValueError: if *name* is not a valid rule or pipeline
+    """
+    pipetools = get_pipetools()
+    if pipetools is None:
+        raise ImportError("sequana_pipetools is not installed")
+
+    paths = _discover()
+    if name not in paths:
+        # not found during the discovery (e.g. a versioned rule); Module
+        # raises a ValueError if the name is invalid
+        paths[name] = pipetools.Module(name).path
+    return paths[name]
+
+
+def list_modules():
+    """Return the names of the installed rules and pipelines
+
+    Returns an empty list if sequana_pipetools is not installed.
+    """
+    if get_pipetools() is None:
+        return []
+    return sorted(_discover())
+
+
+def get_installed_versions():
+    """Return the versions of the installed sequana pipelines
+
+    The metadata of the installed distributions is read once.
+
+    :return: a dictionary mapping the pipeline names (e.g. rnaseq for the
+        sequana_rnaseq or sequana-rnaseq distribution) to their version
+    """
+    global _installed
+    if _installed is None:
+        _installed = {}
+        for dist in metadata.distributions() if metadata else []:
+            name = re.sub(r"[-_.]+", "_", dist.metadata["Name"] or "").lower()
+            if name.startswith("sequana_"):
+                _installed[name[len("sequana_") :]] = dist.version
+    return _installed
+
+
+def get_pipeline_version(name):
+    """Return the version of an installed sequana pipeline
+
+    The version recorded in the snapshot bundle, if any, is returned first.
+    Returns "Not installed locally." if the pipeline is not installed and "?"
+    if its version cannot be found and sequana_pipetools is not installed.
+    """
+    if name not in _versions:
+        snapshot = get_snapshot_versions()
+        installed = get_installed_versions()
+        pipetools = get_pipetools()
+        if name in snapshot:
+            _versions[name] = snapshot[name]
+        elif name in installed:
+            _versions[name] = installed[name]
+        elif pipetools is None:
+            _versions[name] = "?"
+        else:
+            try:
+                _versions[name] = pipetools.Module(f"pipeline:{name}").version
+            except ValueError:
+                _versions[name] = "Not installed locally."
+    return _versions[name]
+
+
+def get_versions():
+    """Return the pipeline versions resolved during the build (name -> version)"""
+    return dict(_versions)
+
+
+def reset(use_pipetools=True):
+    """Forget the discovered pipelines, rules and versions
+
+    :param use_pipetools: if False, behave as if sequana_pipetools was not
+        installed
+    """
+    global _paths, _use_pipetools, _installed
+    _paths = None
+    _installed = None
+    _use_pipetools = use_pipetools
+    _versions.clear()
+
+
+def _builder_inited(app):
+    reset(app.config.sequana_sphinxext_use_pipetools)
+
+
+def setup(app):
+    app.add_config_value("sequana_sphinxext_use_pipetools", True, "env")
+    app.connect("builder-inited", _builder_inited)
+
+    return {
+        "version": "1.0",
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
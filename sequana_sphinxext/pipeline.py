@@ -23,89 +23,56 @@ The name must be a valid sequana rule in the rules directory accesible via the
 :class:`sequana_pipetools.snaketools.Module` class
 
 """
-from docutils.nodes import Body, Element
-import urllib
-from urllib.error import HTTPError
-from sphinx.util.docutils import SphinxDirective
+from sphinx.util import logging
+
+from sequana_sphinxext.engine import SourceKind, make_directive, register_kind, sequana_node, setup_kind
+from sequana_sphinxext.fetch import fetch, FetchError
+from sequana_sphinxext.modules import get_pipeline_version
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_url(name):
+    """Return the URL of the README of a sequana pipeline"""
+    return "https://raw.githubusercontent.com/sequana/{}/master/README.rst".format(name)
 
 
 def get_rule_doc(name):
     """Decode and return the docstring(s) of a sequana/snakemake rule."""
 
-    url = "https://raw.githubusercontent.com/sequana/{}/master/README.rst".format(name)
+    url = get_url(name)
 
     try:
-        data = urllib.request.urlopen(url).read().decode("utf8")
-    except HTTPError:  # pragma: no cover
+        data = fetch(url)
+    except FetchError as err:  # pragma: no cover
+        logger.warning(str(err))
         return f"Could not access to {url}"
 
-    try:
-        from sequana_pipetools import Module
-
-        m = Module(f"pipeline:{name}")
-        version = m.version
-    except ValueError:  # pragma: no cover
-        version = "Not installed locally."
-    except ImportError:  # pragma: no cover
-        version = "?"
+    version = get_pipeline_version(name)
 
     docstring = "**current version**:{}\n\n{}".format(version, data)
 
     return docstring
 
 
-class snakemake_base(Body, Element):  # pragma: no cover
-    def dont_traverse(self, *args, **kwargs):
-        return []
-
-
-class sequana_pipeline_rule(snakemake_base):
+class sequana_pipeline_rule(sequana_node):
     pass
 
 
-def run(content, node_class, state, content_offset):
-    node = node_class("")  # shall we add something here ?
-    node.rule_docstring = get_rule_doc(content[0])
-    state.nested_parse(content, content_offset, node)
-    return [node]
-
-
-class PipelineDirective(SphinxDirective):
-    has_content = True
+KIND = register_kind(
+    SourceKind(
+        "pipeline",
+        directive="sequana_pipeline",
+        node=sequana_pipeline_rule,
+        get_doc=get_rule_doc,
+        get_urls=lambda name: [get_url(name)],
+        css_class="sequana_pipeline",
+    )
+)
 
-    def run(self):
-        return run(self.content, sequana_pipeline_rule, self.state, self.content_offset)
+PipelineDirective = make_directive(KIND)
 
 
 def setup(app):
-    app.add_directive("sequana_pipeline", PipelineDirective)
-
-    # Add visit/depart methods to HTML-Translator:
-    def visit_perform(self, node):
-        # Ideally, we should use sphinx but this is a simple temporary solution
-        from docutils import core
-        from docutils.writers.html4css1 import Writer
-
-        w = Writer()
-        try:
-            res = core.publish_parts(node.rule_docstring, writer=w)["html_body"]
-            self.body.append('<div class="">' + res + "</div>")
-            node.children = []
-        except Exception as err:  # pragma: no cover
-            print(err)
-            self.body.append('<div class=""> no docstring </div>')
-
-    def depart_perform(self, node):
-        node.children = []
-
-    def visit_ignore(self, node):  # pragma: no cover
-        node.children = []
-
-    def depart_ignore(self, node):  # pragma: no cover
-        node.children = []
-
-    app.add_node(
-        sequana_pipeline_rule,
-        html=(visit_perform, depart_perform),
-        latex=(visit_ignore, depart_ignore),
-    )
+    return setup_kind(app, KIND, PipelineDirective)
@@ -22,98 +22,249 @@ a snakemake rule (from sequana project).
 The name must be a valid sequana rule in the rules directory accesible via the
 :class:`sequana.snaketools.Module` class
 
-"""
-from docutils.nodes import Body, Element
-import requests
+Several rules, or glob patterns matching the installed rules (or the rules
+of a local checkout of sequana), can be documented at once::
 
-from sphinx.util.docutils import SphinxDirective
+    .. snakemakerule:: dag fastqc
+        bowtie2_*
 
+Each rules file is parsed once (see :func:`index_rules`) and all rules are
+then served from this index.
 
-def get_rule_doc(name):
-    """Decode and return the docstring(s) of a sequana/snakemake rule."""
-    try:
-        from sequana_pipetools import Module
+"""
+import os
+import re
 
-        rule = Module(name)
-        filename = rule.path + "/%s.rules" % name
-        data = open(filename, "r").read()
-    except ImportError:  # pragma no cover
-        url = "https://raw.githubusercontent.com/sequana/sequana/master/sequana/rules/"
-        if name.count("/") == 0:
-            url = f"{url}/{name}/{name}.rules"
-        elif name.count("/") == 1:
-            # this is a rule with a version name/version/name.rules
-            # and users provided name/version
-            name, version = name.split("/")
-            url = f"{url}/{name}/{version}/{name}.rules"
-        r = requests.get(url)
-        data = r.content.decode()
-        if "404: Not Found" in data:
-            print(f"URL not found: {url}")
-            return f"**docstring for {name} not found**"
+from sphinx.util import logging
+
+from sequana_sphinxext.cache import sha256
+from sequana_sphinxext.engine import SourceKind, make_directive, register_kind, sequana_node, setup_kind
+from sequana_sphinxext.fetch import fetch, get_checkout, FetchError
+from sequana_sphinxext.modules import get_module_path, get_pipetools, list_modules
 
-    # Try to identify the rule and therefore possible docstring
-    # It may be a standard rule or a dynamic rule !
-    # standard one
+
+logger = logging.getLogger(__name__)
+
+
+def get_url(name):
+    """Return the URL of a rule in the sequana repository
+
+    *name* may be a rule name or a versioned rule (name/version).
+    """
+    url = "https://raw.githubusercontent.com/sequana/sequana/master/sequana/rules/"
+    if name.count("/") == 1:
+        # this is a rule with a version name/version/name.rules
+        # and users provided name/version
+        name, version = name.split("/")
+        return f"{url}/{name}/{version}/{name}.rules"
+    return f"{url}/{name}/{name}.rules"
+
+
+def _get_prefetch_urls(name):
+    # rules are read from disk when sequana_pipetools is installed
+    if get_pipetools() is None:
+        return [get_url(name)]
+    return []
+
+
+def list_rules():
+    """Return the names of the available rules
+
+    The rules are listed with sequana_pipetools if installed or found in a
+    checkout of the sequana repository (see the filesystem sources).
+    """
+    names = list_modules()
+    path = get_checkout("sequana")
+    if not names and path and os.path.isdir(os.path.join(path, "sequana", "rules")):
+        names = os.listdir(os.path.join(path, "sequana", "rules"))
+    return sorted(names)
+
+
+class Rule:
+    """Description of a rule found in a rules file (see :func:`index_rules`)
+
+    :attr name: name of the rule (may be a template for dynamic rules e.g.
+        fastqc_%(name)s)
+    :attr docstring: the docstring or None
+    :attr blocks: dictionary with the content of the rule keywords (input,
+        output, params, ...)
+    :attr lineno: line of the rule definition (starts at 1)
+    :attr end_lineno: last line of the rule
+    """
+
+    def __init__(self, name, lineno):
+        self.name = name
+        self.lineno = lineno
+        self.end_lineno = lineno
+        self.docstring = None
+        self.blocks = {}
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, lineno={self.lineno})"
+
+
+_rule_pattern = re.compile(r"^(\s*)rule\s+([^\s:]+)\s*:")
+_keyword_pattern = re.compile(r"^(\s*)(\w+)\s*:(.*)$")
+
+
+def index_rules(data):
+    """Parse the content of a rules file (or Snakefile) in a single pass
+
+    :return: a dictionary mapping the rule names to :class:`Rule` instances
+    """
+    rules = {}
+    rule = None
+    indent = body_indent = 0
+    keyword = None
+    quotes = None
+    docstring = None
+    # the docstring must be the first statement of a rule
+    expect_docstring = False
+
+    for lineno, line in enumerate(data.splitlines(), 1):
+        stripped = line.strip()
+
+        # within a docstring, only look for the closing quotes
+        if quotes:
+            if quotes in line:
+                docstring.append(line[: line.index(quotes)])
+                rule.docstring = "\n".join(docstring)
+                quotes = None
+            else:
+                docstring.append(line)
+            rule.end_lineno = lineno
+            continue
+
+        if not stripped or stripped.startswith("#"):
+            continue
+
+        current_indent = len(line) - len(line.lstrip())
+
+        match = _rule_pattern.match(line)
+        if match:
+            rule = Rule(match.group(2), lineno)
+            rules.setdefault(rule.name, rule)
+            indent = len(match.group(1))
+            body_indent = None
+            keyword = None
+            expect_docstring = True
+            continue
+
+        if rule is None:
+            continue
+        if current_indent <= indent:
+            # end of the rule
+            rule = None
+            continue
+
+        rule.end_lineno = lineno
+        if body_indent is None:
+            body_indent = current_indent
+
+        if expect_docstring:
+            expect_docstring = False
+            if stripped[:3] in ('"""', "'''"):
+                quotes = stripped[:3]
+                text = stripped[3:]
+                if quotes in text:
+                    rule.docstring = text[: text.index(quotes)]
+                    quotes = None
+                else:
+                    docstring = [text]
+                continue
+
+        match = _keyword_pattern.match(line)
+        if match and current_indent == body_indent:
+            keyword = match.group(2)
+            rule.blocks[keyword] = match.group(3).strip()
+        elif keyword:
+            rule.blocks[keyword] = (rule.blocks[keyword] + "\n" + stripped).strip()
+
+    return rules
+
+
+def find_rule(rules, name):
+    """Return the :class:`Rule` called *name* in an index or None
+
+    Dynamic rules (e.g. fastqc_dynamic) are defined with a template name
+    (e.g. fastqc_%(name)s).
+    """
     if name.endswith("_dynamic"):
         name = name[:-8]
-    rulename_tag = "rule %s" % name
-    if rulename_tag in data:
-        data = data.split(rulename_tag, 1)[1]
-    else:
-        return "no docstring found for %s " % name
+    if name in rules:
+        return rules[name]
+    for rule in rules.values():
+        if rule.name.startswith(name + "_%("):
+            return rule
+    return None
 
-    # Find first """ or ''' after the rule definition
-    single = data.find("'''")
-    double = data.find('"""')
-    if single > 0 and double > 0:
-        if single > double:
-            quotes = '"""'
-        else:
-            quotes = "'''"
-    elif single > 0:
-        quotes = "'''"
-    elif double > 0:
-        quotes = '"""'
-    else:
-        return "no docstring found for %s " % name
 
-    start = data.find(quotes)
-    end = data[start + 3 :].find(quotes) + start + 3
+# rules files already indexed during this build (source -> (key, index))
+_indexes = {}
 
-    if end == -1 or end < start:
-        return "no end of docstring found for %s " % name
 
-    docstring = data[start + 3 : end]
-    return docstring
+def get_rule_index(filename=None, url=None):
+    """Return the index of a rules file (see :func:`index_rules`)
 
+    Each file is parsed once; the index of a local file is rebuilt if the
+    file is modified.
 
-class snakemake_base(Body, Element):  # pragma: no cover
-    def dont_traverse(self, *args, **kwargs):
-        return []
+    :param filename: a local rules file
+    :param url: a remote rules file (see :func:`~sequana_sphinxext.fetch.fetch`)
+    :raises FetchError: if the remote file is not available
+    """
+    if filename:
+        key = os.stat(filename).st_mtime_ns
+        if _indexes.get(filename, (None,))[0] != key:
+            with open(filename, "r") as fh:
+                _indexes[filename] = (key, index_rules(fh.read()))
+        return _indexes[filename][1]
 
+    data = fetch(url)
+    key = sha256(data)
+    if _indexes.get(url, (None,))[0] != key:
+        _indexes[url] = (key, index_rules(data))
+    return _indexes[url][1]
 
-class snakemake_rule(snakemake_base):  # pragma: no cover
-    pass
 
-
-def run(content, node_class, state, content_offset):
-    node = node_class("")  # shall we add something here ?
-    name = content[0]
+def get_rule_doc(name):
+    """Decode and return the docstring(s) of a sequana/snakemake rule."""
     try:
-        node.rule_docstring = get_rule_doc(name)
-    except Exception:
-        node.rule_docstring = f"Could not read or interpret documentation for {name}"
-    state.nested_parse(content, content_offset, node)
-    return [node]
+        rules = get_rule_index(filename=get_module_path(name) + "/%s.rules" % name)
+    except ImportError:  # pragma no cover
+        url = get_url(name)
+        if name.count("/") == 1:
+            name = name.split("/")[0]
+        try:
+            rules = get_rule_index(url=url)
+        except FetchError as err:
+            logger.warning(str(err))
+            return f"**docstring for {name} not found**"
+
+    # It may be a standard rule or a dynamic rule !
+    rule = find_rule(rules, name)
+    if rule is None or rule.docstring is None:
+        return "no docstring found for %s " % name
+    return rule.docstring
+
 
+class snakemake_rule(sequana_node):
+    pass
 
-class SnakemakeDirective(SphinxDirective):
 
-    has_content = True
+KIND = register_kind(
+    SourceKind(
+        "rule",
+        directive="snakemakerule",
+        node=snakemake_rule,
+        get_doc=get_rule_doc,
+        get_urls=_get_prefetch_urls,
+        css_class="snakemake",
+        list_targets=list_rules,
+    )
+)
 
-    def run(self):
-        return run(self.content, snakemake_rule, self.state, self.content_offset)
+SnakemakeDirective = make_directive(KIND)
 
 
 def setup(app):
@@ -121,40 +272,4 @@ def setup(app):
     setup.app = app
     setup.config = app.config
     setup.confdir = app.confdir
-    app.add_directive("snakemakerule", SnakemakeDirective)
-
-    # Add visit/depart methods to HTML-Translator:
-    def visit_perform(self, node):
-        # Ideally, we should use sphinx but this is a simple temporary solution
-        from docutils import core
-        from docutils.writers.html4css1 import Writer
-
-        w = Writer()
-        try:
-            res = core.publish_parts(node.rule_docstring, writer=w)["html_body"]
-            self.body.append('<div class="snakemake">' + res + "</div>")
-            node.children = []
-        except Exception as err:
-            print(err)
-            self.body.append('<div class="snakemake"> no docstring </div>')
-
-    def depart_perform(self, node):
-        node.children = []
-
-    def depart_ignore(self, node):  # pragma: no cover
-        node.children = []
-
-    def visit_ignore(self, node):  # pragma: no cover
-        node.children = []
-
-    app.add_node(
-        snakemake_rule,
-        html=(visit_perform, depart_perform),
-        latex=(visit_ignore, depart_ignore),
-    )
-
-    return {
-        "version": "1.0",
-        "parallel_read_safe": True,
-        "parallel_write_safe": True,
-    }
+    return setup_kind(app, KIND, SnakemakeDirective)
@@ -0,0 +1,106 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Snapshot of the documents used by a Sphinx project
+
+All the documents fetched by the sequana directives of a project (wrapper and
+pipeline READMEs, rules files, wrappers archive) can be saved in a single
+bundle file::
+
+    python -m sequana_sphinxext snapshot doc/ -o sequana_bundle.zip
+
+The project is read once (with the Sphinx *dummy* builder and its own
+conf.py) so that every target is resolved exactly as during a real build.
+The bundle can then be shipped as a CI artifact and used by the
+documentation builds instead of the network by setting in the conf.py file::
+
+    sequana_sphinxext_bundle = "sequana_bundle.zip"
+
+The bundle is a compressed zip archive. Its index.json member maps each URL
+to the member storing the content (named after its SHA-256 so that identical
+documents are stored once) together with the hash and size of the content.
+The versions of the pipelines resolved when the snapshot was taken are
+recorded as well. Members are written in a fixed order without timestamps
+so that the same documents always give the same bundle.
+
+"""
+import io
+import json
+import os
+import tempfile
+import zipfile
+
+from sequana_sphinxext import fetch, modules
+from sequana_sphinxext.cache import sha256
+
+
+# version of the bundle layout
+FORMAT = 1
+
+
+def write_bundle(filename, documents, versions=None):
+    """Write a bundle of documents
+
+    :param documents: a dictionary mapping URLs to their content (str)
+    :param versions: optional dictionary of the pipeline versions
+    :return: the index stored in the bundle
+    """
+    index = {"format": FORMAT, "versions": dict(sorted((versions or {}).items())), "documents": {}}
+    contents = {}
+    for url in sorted(documents):
+        data = documents[url].encode("utf8")
+        digest = sha256(data)
+        contents[digest] = data
+        index["documents"][url] = {"member": f"documents/{digest}", "sha256": digest, "size": len(data)}
+
+    members = [("index.json", json.dumps(index, indent=1, sort_keys=True).encode("utf8"))]
+    members += [(f"documents/{digest}", contents[digest]) for digest in sorted(contents)]
+    with zipfile.ZipFile(filename, "w") as bundle:
+        for name, data in members:
+            # ZipInfo has a fixed date so that the bundle is reproducible
+            info = zipfile.ZipInfo(name)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            bundle.writestr(info, data)
+    return index
+
+
+def create_snapshot(srcdir, filename, confdir=None, status=None):
+    """Fetch the documents used by a Sphinx project and save them in a bundle
+
+    :param srcdir: the source directory of the project
+    :param filename: the bundle to create
+    :param confdir: directory of the conf.py file (defaults to *srcdir*)
+    :param status: stream for the Sphinx messages (None for quiet)
+    :return: the index stored in the bundle and the list of URLs that could
+        not be fetched
+    """
+    from sphinx.application import Sphinx
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = Sphinx(
+            srcdir,
+            confdir or srcdir,
+            os.path.join(tmpdir, "out"),
+            os.path.join(tmpdir, "doctrees"),
+            "dummy",
+            # documents are fetched again, not read from a previous bundle
+            confoverrides={"sequana_sphinxext_bundle": ""},
+            status=status,
+            warning=status or io.StringIO(),
+            freshenv=True,
+        )
+        app.build()
+
+    # pipelines that are not installed have no version
+    versions = {name: version for name, version in modules.get_versions().items() if version[0].isdigit()}
+    index = write_bundle(filename, fetch.get_documents(), versions)
+    return index, sorted(fetch.get_errors())
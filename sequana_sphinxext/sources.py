@@ -0,0 +1,178 @@
+#
+#  This file is part of Sequana software
+#
+#  Copyright (c) 2016-2021 - Sequana Dev Team (https://sequana.readthedocs.io)
+#
+#  Distributed under the terms of the 3-clause BSD license.
+#  The full license is in the LICENSE file, distributed with this software.
+#
+#  Website:       https://github.com/sequana/sequana
+#  Documentation: http://sequana.readthedocs.io
+#  Contributors:  https://github.com/sequana/sequana/graphs/contributors
+##############################################################################
+"""Local sources of the sequana documents
+
+Documents are identified by their GitHub raw URL e.g.::
+
+    https://raw.githubusercontent.com/sequana/sequana-wrappers/main/wrappers/fastqc/README.md
+
+which is made of the repository name (sequana-wrappers), a branch and the
+path of the file within the repository. The providers defined here read the
+same file from a local mirror of the repositories instead:
+
+- :class:`FileSystemProvider`: a directory with one checkout per repository
+  (e.g. <root>/sequana-wrappers/wrappers/fastqc/README.md)
+- :class:`ArchiveProvider`: a zip archive with the same layout, memory-mapped
+- :class:`SnapshotProvider`: a bundle of documents created by
+  ``python -m sequana_sphinxext snapshot`` (see :mod:`sequana_sphinxext.snapshot`)
+
+The HTTP provider is defined in :mod:`sequana_sphinxext.fetch`.
+
+"""
+import hashlib
+import json
+import mmap
+import os
+import posixpath
+import zipfile
+
+
+GITHUB_URL = "https://raw.githubusercontent.com/sequana"
+
+
+def split_url(url):
+    """Return the (repository, path) of a GitHub raw URL or None"""
+    if not url.startswith(GITHUB_URL + "/"):
+        return None
+    try:
+        repo, branch, path = url[len(GITHUB_URL) + 1 :].split("/", 2)
+    except ValueError:
+        return None
+    return repo, posixpath.normpath(path)
+
+
+class FileSystemProvider:
+    """Read the documents from local checkouts of the sequana repositories
+
+    :param root: directory that contains one checkout per repository
+    :raises FileNotFoundError: if *root* is not a directory
+    """
+
+    def __init__(self, root):
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"No such directory: {root!r}")
+        self.root = root
+
+    def __repr__(self):
+        return f"FileSystemProvider({self.root!r})"
+
+    def get_checkout(self, repo):
+        """Return the path of the checkout of *repo* or None"""
+        path = os.path.join(self.root, repo)
+        return path if os.path.isdir(path) else None
+
+    def get(self, url, read=None):
+        """Return the content (bytes) of *url* or None if not available
+
+        Documents consumed by a streaming *read* function (e.g. the archive
+        of a repository) are not provided locally.
+        """
+        location = split_url(url)
+        if location is None or read is not None:
+            return None
+        filename = os.path.join(self.root, location[0], *location[1].split("/"))
+        try:
+            with open(filename, "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+
+class _MappedFile(mmap.mmap):
+    # zipfile needs a seekable file object (mmap.seekable exists in 3.13+)
+    def seekable(self):
+        return True
+
+
+class ArchiveProvider:
+    """Read the documents from a zip archive of the sequana repositories
+
+    The archive is memory-mapped so that its members are read at disk speed
+    without loading the whole file. Members are expected to be named
+    <repository>/<path> (e.g. sequana-wrappers/wrappers/fastqc/README.md).
+
+    :param filename: the zip archive
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as fh:
+            self._mmap = _MappedFile(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._zip = zipfile.ZipFile(self._mmap)
+        self._names = set(self._zip.namelist())
+
+    def __repr__(self):
+        return f"ArchiveProvider({self.filename!r})"
+
+    def get_checkout(self, repo):
+        return None
+
+    def get(self, url, read=None):
+        """Return the content (bytes) of *url* or None if not available
+
+        Documents consumed by a streaming *read* function (e.g. the archive
+        of a repository) are not provided locally.
+        """
+        location = split_url(url)
+        if location is None or read is not None:
+            return None
+        name = "/".join(location)
+        if name not in self._names:
+            return None
+        return self._zip.read(name)
+
+
+class SnapshotProvider:
+    """Read the documents from a snapshot bundle
+
+    A bundle is a compressed zip archive with an index.json member mapping
+    each URL to the member holding its content (see
+    :func:`sequana_sphinxext.snapshot.create_snapshot`). Unlike the other
+    providers, any URL can be stored in a bundle. The content of each
+    document is checked against the SHA-256 recorded in the index.
+
+    The versions of the pipelines recorded when the snapshot was taken are
+    available as :attr:`versions` (see
+    :func:`sequana_sphinxext.modules.get_pipeline_version`).
+
+    :param filename: the bundle
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as fh:
+            self._mmap = _MappedFile(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._zip = zipfile.ZipFile(self._mmap)
+        self.index = json.loads(self._zip.read("index.json"))
+        self.versions = self.index.get("versions", {})
+
+    def __repr__(self):
+        return f"SnapshotProvider({self.filename!r})"
+
+    def get_checkout(self, repo):
+        return None
+
+    def get(self, url, read=None):
+        """Return the content (bytes) of *url* or None if not in the bundle
+
+        :raises FetchError: if the content does not match its hash
+        """
+        entry = self.index["documents"].get(url)
+        if entry is None:
+            return None
+        data = self._zip.read(entry["member"])
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            from sequana_sphinxext.fetch import FetchError
+
+            raise FetchError(url, f"corrupted document in {self.filename}")
+        return data
@@ -19,96 +19,294 @@ a sequana wrappers Snakefile .
 
     .. sequana_wrapper: multiqc
 
-The name must be a valid sequana wrappers
+The name must be a valid sequana wrappers. By default, the Documentation,
+Example, Configuration and References sections of the README are included.
+Other sections can be requested::
 
-"""
-import requests
-from docutils.nodes import Body, Element
+    .. sequana_wrapper:: multiqc
+        :sections: Documentation, Example
+
+Several wrappers (or glob patterns) can be documented by one directive::
+
+    .. sequana_wrapper:: fastqc, multiqc, bowtie2*
+
+The wrappers matching a glob pattern are listed and read from the archive of
+the sequana-wrappers repository (see below), downloaded once.
 
+The entire catalogue of wrappers (or the wrappers matching a glob pattern)
+can be documented at once. The sequana-wrappers repository is then downloaded
+once as an archive (or read from a local checkout set with the
+**sequana_sphinxext_wrappers_path** option of the conf.py file or found in the
+filesystem sources, see :mod:`sequana_sphinxext.fetch`)::
 
+    .. sequana_wrapper_catalog:: fastq*
+
+"""
+import fnmatch
+import glob
+import json
+import os
+import tarfile
+
+from docutils import nodes
+from docutils.parsers.rst import directives
+from sphinx.util import logging
 from sphinx.util.docutils import SphinxDirective
 
+from sequana_sphinxext import metrics
+from sequana_sphinxext.engine import SourceKind, make_directive, parse, register_kind, sequana_node, setup_kind
+from sequana_sphinxext.fetch import (
+    fetch,
+    get_checkout,
+    get_document,
+    get_key,
+    is_pattern,
+    note_target,
+    register_prefetch,
+    register_reader,
+    FetchError,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+ARCHIVE_URL = "https://codeload.github.com/sequana/sequana-wrappers/tar.gz/refs/heads/main"
+
+# sections of the README included by default, in this order
+SECTIONS = ("Documentation", "Example", "Configuration", "References")
+# sections rendered as literal blocks
+LITERAL_SECTIONS = ("Example", "Configuration")
+
+# key of the archive fetched during the build and its READMEs
+_archive = (None, None)
+
+
+def get_url(name):
+    """Return the URL of the README of a sequana wrapper"""
+    return f"https://raw.githubusercontent.com/sequana/sequana-wrappers/main/wrappers/{name}/README.md"
+
+
+def get_rule_doc(name, sections=SECTIONS):
+    """Decode and return the docstring(s) of a sequana wrapper.
 
-def get_rule_doc(name):
-    """Decode and return the docstring(s) of a sequana wrapper."""
+    The README is read from the archive of the wrappers if it was already
+    fetched during the build (e.g. to expand a glob pattern).
 
-    url = "https://raw.githubusercontent.com/sequana/sequana-wrappers/main/wrappers"
+    :param sections: the sections of the README to include (see
+        :func:`format_readme`)
+    """
+    readmes = _get_archive_readmes()
+    if readmes and name in readmes:
+        return format_readme(name, readmes[name], sections)
 
-    url = f"{url}/{name}/README.md"
-    r = requests.get(url)
+    url = get_url(name)
 
     title = f"**{name}**\n\n"
-    data = r.content.decode()
-    rulename_tag = "rule %s" % name
 
-    if "404: Not Found" in data:  # pragma no cover
-        print(f"URL not found: {url}")
+    try:
+        data = fetch(url)
+    except FetchError as err:  # pragma no cover
+        logger.warning(str(err))
         return title + f"**docstring for {name} wrapper not yet available (no README.md found)**"
 
-    def get_section(data, section):
-
-        if section in ["Example", "Configuration"]:
-            code = f"\n**{section}**\n::\n\n"
-        elif section in ["References", "Reference"]:
-            code = f"\n**{section}**\n\n"
-        else:
-            code = ""
-        found = False
-        for line in data.split("\n"):
-            # while requested section is not found, we parse the data
-            if line.startswith(f"# {section}") and not found:
-                found = True
-                continue
-            elif found and line.startswith("# "):
-                # a new section is found so, we can stop here and return the
-                # current code
-                return code
-            # the actual section is stored here
-            if found:
-                code += line + "\n"
-        if found:
-            return code
-        else:
-            return ""
-
-    example_code = get_section(data, "Example")
-    docstring = get_section(data, "Documentation")
-    config = get_section(data, "Configuration")
-    ref = get_section(data, "References")
-
-    url = f"https://github.com/sequana/sequana-wrappers/blob/main/wrappers/{name}/README.md"
-    rst = f"The `{name} <{url}>`_ wrapper "
-    rst += docstring + example_code + config + ref
-    rst += f"\n\n....\n\nFound a bug or have an issue ? Please report here https://github.com/sequana/sequana-wrappers/issues"
-    return rst
+    return format_readme(name, data, sections)
 
 
-class snakemake_base(Body, Element):  # pragma: no cover
-    def dont_traverse(self, *args, **kwargs):
+def _extract_readmes(response):
+    # stream-extract the wrappers/<name>/README.md members of the archive
+    # and return them as a JSON mapping name -> README content
+    response.raw.decode_content = True
+    readmes = {}
+    try:
+        with tarfile.open(fileobj=response.raw, mode="r|gz") as tar:
+            for member in tar:
+                parts = member.name.split("/")
+                if member.isfile() and len(parts) == 4 and parts[1] == "wrappers" and parts[3] == "README.md":
+                    readmes[parts[2]] = tar.extractfile(member).read().decode("utf8")
+    except (tarfile.TarError, EOFError, UnicodeDecodeError) as err:
+        # e.g. the HTML page of a proxy instead of the archive
+        raise FetchError(response.url, f"not a valid archive of the wrappers ({err})") from err
+    return json.dumps(readmes).encode("utf8")
+
+
+def _get_archive_readmes():
+    # the READMEs of the archive if it was fetched during the build (decoded
+    # once per archive) or None
+    global _archive
+    key = get_key(ARCHIVE_URL)
+    if key is None:
+        return None
+    if _archive[0] != key:
+        _archive = (key, json.loads(get_document(key)))
+    return _archive[1]
+
+
+def _get_urls(name):
+    # the wrappers matching a glob pattern are read from the archive (or a
+    # local checkout), and so is any wrapper once the archive was fetched
+    if is_pattern(name):
+        return _get_catalog_urls(name)
+    readmes = _get_archive_readmes()
+    if readmes and name in readmes:
+        return [ARCHIVE_URL]
+    return [get_url(name)]
+
+
+def _get_catalog_urls(pattern):
+    # the archive is not needed if a local checkout of the wrappers is used
+    if setup.config.sequana_sphinxext_wrappers_path or get_checkout("sequana-wrappers"):
         return []
+    return [ARCHIVE_URL]
+
+
+def get_readmes(path=None):
+    """Return the README of all sequana wrappers as a dictionary
+
+    :param path: a local checkout of the sequana-wrappers repository. If not
+        provided, the checkout of the filesystem sources is used or the
+        repository is downloaded once as an archive.
+    """
+    path = path or get_checkout("sequana-wrappers")
+    if path:
+        readmes = {}
+        for filename in glob.glob(os.path.join(path, "wrappers", "*", "README.md")):
+            with open(filename, "r") as fh:
+                readmes[os.path.basename(os.path.dirname(filename))] = fh.read()
+        return readmes
+    fetch(ARCHIVE_URL, read=_extract_readmes)
+    return _get_archive_readmes()
+
+
+def get_catalog_doc(pattern="*", path=None, sections=SECTIONS):
+    """Return the documentation of all wrappers matching a glob *pattern*
+
+    :param pattern: a glob pattern (e.g. fastq*)
+    :param path: see :func:`get_readmes`
+    :param sections: see :func:`format_readme`
+    :return: a dictionary with the wrapper names as keys (sorted) and the
+        documentation as values (see :func:`get_rule_doc`)
+    """
+    readmes = get_readmes(path)
+    return {name: format_readme(name, readmes[name], sections) for name in sorted(fnmatch.filter(readmes, pattern))}
+
+
+def index_sections(data):
+    """Return the level-1 sections of a Markdown README
+
+    The README is scanned once. Headings found in fenced code blocks are
+    ignored. If a heading appears several times, the first one is kept.
+
+    :return: a dictionary mapping each heading to the (start, end) offsets of
+        its content so that a section is simply ``data[start:end]``
+    """
+    index = {}
+    heading, start = None, 0
+    fenced = False
+    offset = 0
+    for line in data.splitlines(keepends=True):
+        if line.startswith("```"):
+            fenced = not fenced
+        elif line.startswith("# ") and not fenced:
+            if heading is not None:
+                index.setdefault(heading, (start, offset))
+            heading, start = line[2:].strip(), offset + len(line)
+        offset += len(line)
+    if heading is not None:
+        index.setdefault(heading, (start, offset))
+    return index
+
+
+def get_section(data, index, section):
+    """Return the content of a *section* of a README or None
+
+    :param index: the output of :func:`index_sections`
+    :param section: the heading; a heading starting with *section* (e.g.
+        References for Reference) is used if there is no exact match.
+    """
+    if section not in index:
+        section = next((x for x in index if x.startswith(section)), None)
+        if section is None:
+            return None
+    start, end = index[section]
+    return data[start:end]
+
+
+def format_readme(name, data, sections=SECTIONS):
+    """Convert the README of a wrapper into the reST documentation
+
+    :param sections: the sections of the README to include, in this order.
+        Missing sections are ignored.
+    """
+    index = index_sections(data)
 
-
-class sequana_wrapper(snakemake_base):  # pragma: no cover
+    url = f"https://github.com/sequana/sequana-wrappers/blob/main/wrappers/{name}/README.md"
+    rst = [f"The `{name} <{url}>`_ wrapper "]
+    for section in sections:
+        content = get_section(data, index, section)
+        if content is None:
+            continue
+        if section in LITERAL_SECTIONS:
+            rst.append(f"\n**{section}**\n::\n\n")
+        elif section != "Documentation":
+            rst.append(f"\n**{section}**\n\n")
+        rst.append(content)
+    rst.append(f"\n\nFound a bug or have an issue ? Please report here https://github.com/sequana/sequana-wrappers/issues")
+    return "".join(rst)
+
+
+def sections_option(argument):
+    """Convert the :sections: option (comma-separated list)"""
+    return tuple(x.strip() for x in directives.unchanged_required(argument).split(",") if x.strip())
+
+
+class sequana_wrapper(sequana_node):
     pass
 
 
-def run(content, node_class, state, content_offset):
-    node = node_class("")  # shall we add something here ?
-    name = content[0]
-    try:
-        node.rule_docstring = get_rule_doc(name)
-    except Exception:  # pragma: no cover
-        node.rule_docstring = f"Could not read or interpret documentation for {name}"
-    state.nested_parse(content, content_offset, node)
-    return [node]
+KIND = register_kind(
+    SourceKind(
+        "wrapper",
+        directive="sequana_wrapper",
+        node=sequana_wrapper,
+        get_doc=get_rule_doc,
+        get_urls=_get_urls,
+        option_spec={"sections": sections_option},
+        list_targets=lambda: list(get_readmes()),
+    )
+)
 
+SnakemakeDirective = make_directive(KIND)
 
-class SnakemakeDirective(SphinxDirective):
 
-    has_content = True
+class CatalogDirective(SphinxDirective):
+
+    optional_arguments = 1
+    option_spec = {"sections": sections_option}
 
     def run(self):
-        return run(self.content, sequana_wrapper, self.state, self.content_offset)
+        pattern = self.arguments[0] if self.arguments else "*"
+        with metrics.directive(self.env, self.name, pattern):
+            return self._run(pattern)
+
+    def _run(self, pattern):
+        path = self.config.sequana_sphinxext_wrappers_path
+        path = os.path.join(self.env.srcdir, path) if path else get_checkout("sequana-wrappers")
+        if path:
+            for filename in glob.glob(os.path.join(path, "wrappers", "*", "README.md")):
+                self.env.note_dependency(filename)
+        try:
+            with metrics.phase("fetch"):
+                docs = get_catalog_doc(pattern, path=path, sections=self.options.get("sections", SECTIONS))
+        except FetchError as err:
+            return [self.state.document.reporter.warning(str(err), line=self.lineno)]
+        # the page is read again when the archive changes upstream
+        note_target(self.env, self.name, pattern)
+
+        result = []
+        for name, docstring in docs.items():
+            result += [nodes.rubric(text=name), parse(KIND, name, docstring, self.state)]
+        return result
 
 
 def setup(app):
@@ -116,40 +314,9 @@ def setup(app):
     setup.app = app
     setup.config = app.config
     setup.confdir = app.confdir
-    app.add_directive("sequana_wrapper", SnakemakeDirective)
-
-    # Add visit/depart methods to HTML-Translator:
-    def visit_perform(self, node):
-        # Ideally, we should use sphinx but this is a simple temporary solution
-        from docutils import core
-        from docutils.writers.html4css1 import Writer
-
-        w = Writer()
-        try:
-            res = core.publish_parts(node.rule_docstring, writer=w)["html_body"]
-            self.body.append('<div class="sequana_wrapper">' + res + "</div><br>")
-            node.children = []
-        except Exception as err:  # pragma: no cover
-            print(err)
-            self.body.append('<div class="sequana_wrapper"> no valid docstring </div>')
-
-    def depart_perform(self, node):
-        node.children = []
-
-    def depart_ignore(self, node):  # pragma: no cover
-        node.children = []
-
-    def visit_ignore(self, node):  # pragma: no cover
-        node.children = []
-
-    app.add_node(
-        sequana_wrapper,
-        html=(visit_perform, depart_perform),
-        latex=(visit_ignore, depart_ignore),
-    )
-
-    return {
-        "version": "1.0",
-        "parallel_read_safe": True,
-        "parallel_write_safe": True,
-    }
+    app.add_directive("sequana_wrapper_catalog", CatalogDirective)
+    app.add_config_value("sequana_sphinxext_wrappers_path", None, "env")
+    metadata = setup_kind(app, KIND, SnakemakeDirective)
+    register_reader(ARCHIVE_URL, _extract_readmes)
+    register_prefetch("sequana_wrapper_catalog", _get_catalog_urls)
+    return metadata
@@ -52,6 +52,7 @@ setup(
     packages=find_packages(exclude=["tests*"]),
     install_requires=open("requirements.txt", "r").read(),
     tests_require=["pytest", "coverage", "pytest-cov"],
+    extras_require={"asyncio": ["aiohttp"]},
     # This is recursive include of data files
     exclude_package_data={"": ["__pycache__"]},
     zip_safe=False,
@@ -0,0 +1,70 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sequana_sphinxext import engine, fetch
+
+
+@pytest.fixture(autouse=True)
+def reset_fetch():
+    """Reset the fetch layer configured by the previous test or Sphinx build"""
+    fetch.configure()
+    engine.configure()
+    yield
+    fetch.configure()
+    engine.configure()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.hits.append(self.path)
+        time.sleep(server.delay)
+        if server.failures.get(self.path):
+            server.failures[self.path] -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path not in server.files:
+            self.send_response(404)
+            self.end_headers()
+            self.wfile.write(b"404: Not Found")
+            return
+        content = server.files[self.path]
+        if isinstance(content, str):
+            content = content.encode("utf8")
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+@pytest.fixture
+def httpserver():
+    """A local HTTP server serving the *files* dict (path -> text or bytes)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.files = {}
+    # path -> number of 503 responses to send before serving the file
+    server.failures = {}
+    # seconds to wait before answering
+    server.delay = 0
+    server.hits = []
+    server.url = "http://127.0.0.1:%s" % server.server_port
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
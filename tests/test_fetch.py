@@ -0,0 +1,343 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sequana_sphinxext import fetch
+from sequana_sphinxext.cache import RenderCache
+
+
+def test_fetch_no_cache(httpserver):
+    httpserver.files["/README.md"] = "hello"
+    fetch.configure()
+    assert fetch.fetch(httpserver.url + "/README.md") == "hello"
+    # second call is served from memory
+    assert fetch.fetch(httpserver.url + "/README.md") == "hello"
+    assert len(httpserver.hits) == 1
+
+    with pytest.raises(fetch.FetchError) as err:
+        fetch.fetch(httpserver.url + "/missing")
+    assert err.value.status == 404
+
+
+def test_fetch_cache(httpserver, tmpdir):
+    httpserver.files["/README.md"] = "hello"
+    url = httpserver.url + "/README.md"
+
+    # fresh entries do not access the network
+    fetch.configure(cache_dir=str(tmpdir), ttl=3600)
+    assert fetch.fetch(url) == "hello"
+    fetch.configure(cache_dir=str(tmpdir), ttl=3600)
+    assert fetch.fetch(url) == "hello"
+    assert len(httpserver.hits) == 1
+
+    # stale entries are revalidated (304)
+    fetch.configure(cache_dir=str(tmpdir), ttl=0)
+    assert fetch.fetch(url) == "hello"
+    assert len(httpserver.hits) == 2
+
+    # and updated if the remote content changed
+    httpserver.files["/README.md"] = "world"
+    fetch.configure(cache_dir=str(tmpdir), ttl=0)
+    assert fetch.fetch(url) == "world"
+
+    # cache-only mode
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, cache_only=True)
+    assert fetch.fetch(url) == "world"
+    assert len(httpserver.hits) == 3
+    with pytest.raises(fetch.FetchError):
+        fetch.fetch(httpserver.url + "/other")
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, mode="offline")
+    assert fetch.fetch(url) == "world"
+    assert len(httpserver.hits) == 3
+    with pytest.raises(ValueError):
+        fetch.configure(mode="cached")
+
+
+def test_stale_while_revalidate(httpserver, tmpdir):
+    url = httpserver.url + "/README.md"
+    httpserver.files["/README.md"] = "hello"
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, mode="stale-while-revalidate")
+    # not cached: downloaded at once
+    assert fetch.fetch(url) == "hello"
+    assert len(httpserver.hits) == 1
+
+    # stale documents are returned without waiting for the server
+    httpserver.files["/README.md"] = "world"
+    httpserver.delay = 2
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, mode="stale-while-revalidate")
+    start = time.time()
+    assert fetch.fetch(url) == "hello"
+    assert time.time() - start < 1
+    # and updated in the background for the next build
+    assert fetch.wait_refresh(10)
+    assert len(httpserver.hits) == 2
+    httpserver.delay = 0
+    fetch.configure(cache_dir=str(tmpdir), ttl=3600)
+    assert fetch.fetch(url) == "world"
+    assert len(httpserver.hits) == 2
+
+    # background failures are ignored
+    httpserver.files.clear()
+    httpserver.failures["/README.md"] = 10
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, retries=0, mode="stale-while-revalidate")
+    assert fetch.fetch(url) == "world"
+    assert fetch.wait_refresh(10)
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, mode="offline")
+    assert fetch.fetch(url) == "world"
+
+
+def test_scan_directives():
+    text = """
+Title
+=====
+
+.. sequana_wrapper:: fastqc
+
+    .. snakemakerule:: dag
+
+.. sequana_pipeline:: rnaseq
+.. note:: not a sequana directive
+
+.. sequana_wrapper:: fastp, multiqc
+    :sections: Documentation
+
+    fastq_*
+    bowtie2
+
+Text
+"""
+    found = fetch.scan_directives(text, ["sequana_wrapper", "snakemakerule", "sequana_pipeline"])
+    assert found == [
+        ("sequana_wrapper", "fastqc"),
+        ("snakemakerule", "dag"),
+        ("sequana_pipeline", "rnaseq"),
+        ("sequana_wrapper", "fastp"),
+        ("sequana_wrapper", "multiqc"),
+        ("sequana_wrapper", "bowtie2"),
+    ]
+
+
+def test_prefetch(httpserver):
+    fetch.configure()
+    urls = []
+    for i in range(20):
+        httpserver.files[f"/{i}/README.md"] = f"doc {i}"
+        urls.append(f"{httpserver.url}/{i}/README.md")
+    urls.append(httpserver.url + "/missing")
+
+    fetch.prefetch(urls + urls, workers=4)
+    assert len(httpserver.hits) == 21
+
+    # the directives now read the documents from memory
+    assert fetch.fetch(urls[3]) == "doc 3"
+    assert len(httpserver.hits) == 21
+
+
+def test_session_retries(httpserver):
+    fetch.configure(retries=2)
+    session = fetch.get_session()
+    assert fetch.get_session() is session
+
+    httpserver.files["/README.md"] = "hello"
+    httpserver.failures["/README.md"] = 2
+    assert fetch.fetch(httpserver.url + "/README.md") == "hello"
+    assert len(httpserver.hits) == 3
+
+    fetch.configure(retries=0)
+    assert fetch.get_session() is not session
+    httpserver.failures["/README.md"] = 1
+    with pytest.raises(fetch.FetchError) as err:
+        fetch.fetch(httpserver.url + "/README.md")
+    assert err.value.status == 503
+
+
+def test_single_flight(httpserver):
+    httpserver.files["/README.md"] = "hello"
+    httpserver.delay = 0.2
+    url = httpserver.url + "/README.md"
+    fetch.configure()
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(executor.map(fetch.fetch, [url] * 10))
+    assert results == ["hello"] * 10
+    assert len(httpserver.hits) == 1
+
+    # errors are shared as well
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(fetch.fetch, httpserver.url + "/missing") for _ in range(5)]
+    for future in futures:
+        assert isinstance(future.exception(), fetch.FetchError)
+    assert len(httpserver.hits) == 2
+
+
+def _fetch_in_process(cache_dir, url, queue):
+    fetch.configure(cache_dir=cache_dir)
+    queue.put(fetch.fetch(url))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="requires fork")
+def test_single_flight_processes(httpserver, tmpdir):
+    httpserver.files["/README.md"] = "hello"
+    httpserver.delay = 0.2
+    url = httpserver.url + "/README.md"
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [context.Process(target=_fetch_in_process, args=(str(tmpdir), url, queue)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [queue.get() for _ in processes] == ["hello"] * 4
+    # the first process downloads, the others wait for the lock and use the cache
+    assert len(httpserver.hits) == 1
+
+
+def _check_fork(session, queue):
+    queue.put((fetch._session is None, not fetch._inflight, fetch.get_session() is not session))
+
+
+def test_fork_reset():
+    session = fetch.get_session()
+    fetch._inflight["https://example.com/README.md"] = None
+    try:
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_check_fork, args=(session, queue))
+        process.start()
+        process.join()
+        # the parallel readers do not share the connections of the parent
+        assert queue.get() == (True, True, True)
+    finally:
+        fetch._inflight.clear()
+
+
+def test_max_bytes(httpserver, tmpdir):
+    httpserver.files["/small.md"] = "hello"
+    httpserver.files["/large.md"] = "x" * 1000
+    fetch.configure(cache_dir=str(tmpdir), max_bytes=100)
+
+    assert fetch.fetch(httpserver.url + "/small.md") == "hello"
+    with pytest.raises(fetch.FetchError, match="larger than 100 bytes"):
+        fetch.fetch(httpserver.url + "/large.md")
+    # not stored in the cache
+    assert fetch._cache.get(httpserver.url + "/large.md") is None
+    # the limit applies to the output of the read functions as well
+    httpserver.files["/other.md"] = "hello"
+    with pytest.raises(fetch.FetchError, match="larger than 100 bytes"):
+        fetch.fetch(httpserver.url + "/other.md", read=lambda r: b"y" * 200)
+
+    fetch.configure(cache_dir=str(tmpdir), max_bytes=None)
+    assert fetch.fetch(httpserver.url + "/large.md") == "x" * 1000
+
+
+def test_negative_cache(httpserver, tmpdir):
+    url = httpserver.url + "/missing"
+    fetch.configure(cache_dir=str(tmpdir))
+    for _ in range(3):
+        with pytest.raises(fetch.FetchError) as err:
+            fetch.fetch(url)
+        assert err.value.status == 404
+    assert len(httpserver.hits) == 1
+
+    # next build: still recorded as missing in the cache
+    fetch.configure(cache_dir=str(tmpdir))
+    with pytest.raises(fetch.FetchError):
+        fetch.fetch(url)
+    assert len(httpserver.hits) == 1
+
+    # until the negative TTL expires
+    httpserver.files["/missing"] = "found"
+    fetch.configure(cache_dir=str(tmpdir), negative_ttl=0)
+    assert fetch.fetch(url) == "found"
+    assert fetch._cache.get_missing(url) is None
+
+
+def test_circuit_breaker(httpserver, tmpdir):
+    for i in range(5):
+        httpserver.files[f"/{i}"] = f"doc {i}"
+    fetch.configure(cache_dir=str(tmpdir))
+    assert fetch.fetch(httpserver.url + "/0") == "doc 0"
+
+    # the server fails: after 2 consecutive failures, it is no longer accessed
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, retries=0, max_failures=2)
+    for i in range(5):
+        httpserver.failures[f"/{i}"] = 10
+    hits = len(httpserver.hits)
+    for i in range(1, 5):
+        with pytest.raises(fetch.FetchError):
+            fetch.fetch(f"{httpserver.url}/{i}")
+    assert len(httpserver.hits) == hits + 2
+    # stale cached documents are still used
+    assert fetch.fetch(httpserver.url + "/0") == "doc 0"
+    assert len(httpserver.hits) == hits + 2
+
+
+@pytest.mark.parametrize("client", ["aiohttp", "requests"])
+def test_asyncio_backend(httpserver, tmpdir, monkeypatch, client):
+    from sequana_sphinxext import aio
+
+    if client == "requests":
+        monkeypatch.setattr(aio, "aiohttp", None)
+    elif aio.aiohttp is None:
+        pytest.skip("aiohttp is not installed")
+
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, backend="asyncio", retries=1)
+    urls = []
+    for i in range(20):
+        httpserver.files[f"/{i}/README.md"] = f"doc {i}"
+        urls.append(f"{httpserver.url}/{i}/README.md")
+    httpserver.failures["/0/README.md"] = 1
+    urls.append(httpserver.url + "/missing")
+
+    fetch.prefetch(urls + urls, workers=50)
+    # 20 documents, 1 retry and 1 missing document
+    assert len(httpserver.hits) == 22
+    assert fetch.fetch(urls[3]) == "doc 3"
+    assert len(httpserver.hits) == 22
+    with pytest.raises(fetch.FetchError):
+        fetch.fetch(urls[-1])
+
+    # next build: revalidated (304) by the event loop
+    fetch.configure(cache_dir=str(tmpdir), ttl=0, backend="asyncio")
+    httpserver.files["/5/README.md"] = "new doc 5"
+    fetch.prefetch(urls[:20], workers=50)
+    assert fetch.get_documents()[urls[5]] == "new doc 5"
+    assert fetch.get_documents()[urls[6]] == "doc 6"
+
+    with pytest.raises(ValueError):
+        fetch.configure(backend="gevent")
+
+
+def test_document_store(httpserver):
+    for name in ("a", "b"):
+        httpserver.files[f"/{name}/README.md"] = "same"
+    httpserver.files["/c/README.md"] = "other"
+    urls = [httpserver.url + f"/{name}/README.md" for name in "abc"]
+    fetch.prefetch(urls, workers=3)
+
+    # identical documents are stored once
+    keys = [fetch.get_key(url) for url in urls]
+    assert keys[0] is keys[1] and keys[0] != keys[2]
+    assert len(fetch._documents) == 2
+    assert fetch.fetch(urls[1]) is fetch.get_document(keys[0])
+    assert fetch.get_key(httpserver.url + "/d/README.md") is None
+
+
+def test_render_cache(tmpdir):
+    cache = RenderCache(str(tmpdir), max_size=250)
+    for i in range(3):
+        cache.set(f"key{i}", bytes(100))
+        os.utime(str(tmpdir.join(f"key{i}.pickle")), (i, i))
+    # the least recently used entry was removed
+    assert sorted(os.listdir(str(tmpdir))) == ["key1.pickle", "key2.pickle"]
+
+    cache = RenderCache(str(tmpdir), max_size=250)
+    assert cache.get("key0") is None
+    assert cache.get("key1") == bytes(100)
+    cache.set("key3", bytes(100))
+    # key1 was used more recently than key2
+    assert sorted(os.listdir(str(tmpdir))) == ["key1.pickle", "key3.pickle"]
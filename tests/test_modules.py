@@ -0,0 +1,97 @@
+import sys
+import types
+
+import pytest
+
+from sequana_sphinxext import modules
+
+
+@pytest.fixture
+def pipetools(monkeypatch, tmpdir):
+    """A fake sequana_pipetools with one pipeline (fastqc) and one rule (dag)"""
+    created = []
+
+    class Module:
+        def __init__(self, name):
+            created.append(name)
+            if name not in ("dag", "pipeline:fastqc"):
+                raise ValueError(name)
+            self.path = str(tmpdir.join(name))
+            self.version = "1.2.3"
+
+    class ModuleFinder:
+        def __init__(self):
+            self._paths = {"dag": str(tmpdir.join("dag")), "fastqc": str(tmpdir.join("fastqc"))}
+
+    package = types.ModuleType("sequana_pipetools")
+    package.Module = Module
+    snaketools = types.ModuleType("sequana_pipetools.snaketools")
+    snaketools.ModuleFinder = ModuleFinder
+    package.snaketools = snaketools
+    monkeypatch.setitem(sys.modules, "sequana_pipetools", package)
+    monkeypatch.setitem(sys.modules, "sequana_pipetools.snaketools", snaketools)
+    monkeypatch.setattr(modules, "_pipetools", None)
+    modules.reset()
+    yield created
+    modules.reset()
+
+
+def test_registry(pipetools, tmpdir):
+    assert modules.get_pipetools() is sys.modules["sequana_pipetools"]
+    for _ in range(10):
+        assert modules.get_module_path("dag") == str(tmpdir.join("dag"))
+        assert modules.get_pipeline_version("fastqc") == "1.2.3"
+        assert modules.get_pipeline_version("rnaseq") == "Not installed locally."
+    # only one Module per pipeline; rules are found by the discovery
+    assert pipetools == ["pipeline:fastqc", "pipeline:rnaseq"]
+
+    with pytest.raises(ValueError):
+        modules.get_module_path("dummy")
+
+
+def test_no_pipetools(monkeypatch):
+    monkeypatch.setitem(sys.modules, "sequana_pipetools", None)
+    monkeypatch.setattr(modules, "_pipetools", None)
+    modules.reset()
+    assert modules.get_pipetools() is None
+    assert modules.get_pipeline_version("fastqc") == "?"
+    with pytest.raises(ImportError):
+        modules.get_module_path("dag")
+
+
+def test_disable_pipetools(pipetools):
+    modules.reset(use_pipetools=False)
+    assert modules.get_pipetools() is None
+    assert modules.get_pipeline_version("fastqc") == "?"
+    modules.reset()
+    assert modules.get_pipetools() is not None
+
+
+def test_installed_versions(pipetools, monkeypatch):
+    class Distribution:
+        def __init__(self, name, version):
+            self.metadata = {"Name": name}
+            self.version = version
+
+    class metadata:
+        calls = 0
+
+        @classmethod
+        def distributions(cls):
+            cls.calls += 1
+            return [
+                Distribution("sequana-rnaseq", "0.15.1"),
+                Distribution("Sequana_FastQC", "1.5.0"),
+                Distribution("requests", "2.0"),
+            ]
+
+    monkeypatch.setattr(modules, "metadata", metadata)
+    modules.reset()
+    assert modules.get_installed_versions() == {"rnaseq": "0.15.1", "fastqc": "1.5.0"}
+    for _ in range(10):
+        assert modules.get_pipeline_version("rnaseq") == "0.15.1"
+        assert modules.get_pipeline_version("fastqc") == "1.5.0"
+    # sequana_pipetools only used on a miss; metadata read once
+    assert modules.get_pipeline_version("variant") == "Not installed locally."
+    assert pipetools == ["pipeline:variant"]
+    assert metadata.calls == 1
@@ -0,0 +1,94 @@
+import os
+import zipfile
+
+from sphinx.application import Sphinx
+
+import pytest
+
+from sequana_sphinxext import fetch, modules, pipeline, wrapper
+from sequana_sphinxext.__main__ import main
+from sequana_sphinxext.sources import SnapshotProvider
+from sequana_sphinxext.snapshot import write_bundle
+
+
+CONF = """
+extensions = ["sequana_sphinxext.pipeline", "sequana_sphinxext.wrapper"]
+master_doc = "index"
+sequana_sphinxext_sources = {sources!r}
+sequana_sphinxext_bundle = {bundle!r}
+"""
+
+
+def _project(root, sources, bundle=None):
+    with open(os.path.join(root, "index.rst"), "w") as fh:
+        fh.write("Title\n=====\n\n.. sequana_wrapper:: fastqc\n\n.. sequana_pipeline:: fastqc\n")
+    with open(os.path.join(root, "conf.py"), "w") as fh:
+        fh.write(CONF.format(sources=sources, bundle=bundle))
+
+
+def test_write_bundle(tmpdir):
+    filename = str(tmpdir.join("bundle.zip"))
+    documents = {"https://a/README.md": "same", "https://b/README.md": "same", "https://c/README.md": "other"}
+    index = write_bundle(filename, documents, {"fastqc": "1.0.0"})
+    assert index["versions"] == {"fastqc": "1.0.0"}
+    with zipfile.ZipFile(filename) as bundle:
+        # identical documents stored once
+        assert len(bundle.namelist()) == 3
+
+    provider = SnapshotProvider(filename)
+    assert provider.get("https://b/README.md") == b"same"
+    assert provider.get("https://d/README.md") is None
+    assert provider.versions == {"fastqc": "1.0.0"}
+
+    # the content is checked against its hash
+    provider.index["documents"]["https://c/README.md"]["sha256"] = index["documents"]["https://a/README.md"]["sha256"]
+    with pytest.raises(fetch.FetchError):
+        provider.get("https://c/README.md")
+
+    # reproducible
+    with open(filename, "rb") as fh:
+        data = fh.read()
+    write_bundle(filename, dict(reversed(list(documents.items()))), {"fastqc": "1.0.0"})
+    with open(filename, "rb") as fh:
+        assert fh.read() == data
+
+
+def test_snapshot(httpserver, tmpdir):
+    httpserver.files["/sequana-wrappers/main/wrappers/fastqc/README.md"] = "# Documentation\n\nfastqc wrapper\n"
+    httpserver.files["/fastqc/master/README.rst"] = "fastqc pipeline\n"
+
+    srcdir = str(tmpdir.mkdir("src"))
+    _project(srcdir, [("http", httpserver.url)])
+    bundle = str(tmpdir.join("bundle.zip"))
+    assert main(["snapshot", srcdir, "-o", bundle, "--strict"]) == 0
+
+    index = SnapshotProvider(bundle).index
+    assert sorted(index["documents"]) == sorted([wrapper.get_url("fastqc"), pipeline.get_url("fastqc")])
+    hits = len(httpserver.hits)
+
+    # network-free build from the bundle
+    srcdir = str(tmpdir.mkdir("build"))
+    _project(srcdir, [], bundle)
+    app = Sphinx(srcdir, srcdir, srcdir + "/_build", srcdir + "/_doctrees", "html")
+    app.build()
+    text = app.env.get_doctree("index").astext()
+    assert "fastqc wrapper" in text and "fastqc pipeline" in text
+    assert len(httpserver.hits) == hits
+
+    # missing documents are reported
+    _project(srcdir, [("http", httpserver.url + "/missing")])
+    assert main(["snapshot", srcdir, "-o", bundle, "--strict"]) == 1
+
+
+def test_snapshot_versions(tmpdir):
+    filename = str(tmpdir.join("bundle.zip"))
+    write_bundle(filename, {pipeline.get_url("fastqc"): "fastqc pipeline\n"}, {"fastqc": "9.9.9"})
+    fetch.configure(sources=[("snapshot", filename)])
+    modules.reset()
+    try:
+        # the versions of the bundle are used instead of the installed ones
+        assert fetch.get_snapshot_versions() == {"fastqc": "9.9.9"}
+        assert pipeline.get_rule_doc("fastqc").startswith("**current version**:9.9.9")
+        assert modules.get_versions() == {"fastqc": "9.9.9"}
+    finally:
+        modules.reset()
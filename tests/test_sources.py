@@ -0,0 +1,99 @@
+import os
+import zipfile
+
+import pytest
+
+from sequana_sphinxext import fetch, pipeline, snakemakerule, wrapper
+from sequana_sphinxext.sources import ArchiveProvider, FileSystemProvider, split_url
+
+
+def _mirror(root):
+    files = {
+        "sequana-wrappers/wrappers/fastqc/README.md": "# Documentation\n\nlocal fastqc wrapper\n",
+        "fastqc/README.rst": "local fastqc pipeline\n",
+        "sequana/sequana/rules/dag/dag.rules": 'rule dag:\n    """local dag rule"""\n',
+    }
+    for name, text in files.items():
+        filename = os.path.join(root, *name.split("/"))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as fh:
+            fh.write(text)
+    return files
+
+
+def test_split_url():
+    assert split_url(wrapper.get_url("fastqc")) == ("sequana-wrappers", "wrappers/fastqc/README.md")
+    assert split_url(snakemakerule.get_url("dag")) == ("sequana", "sequana/rules/dag/dag.rules")
+    assert split_url("https://example.com/README.md") is None
+
+
+def test_filesystem_provider(tmpdir):
+    _mirror(str(tmpdir))
+    provider = FileSystemProvider(str(tmpdir))
+    assert provider.get(pipeline.get_url("fastqc")) == b"local fastqc pipeline\n"
+    assert provider.get(pipeline.get_url("rnaseq")) is None
+    assert provider.get_checkout("sequana-wrappers") == os.path.join(str(tmpdir), "sequana-wrappers")
+
+
+def test_archive_provider(tmpdir):
+    files = _mirror(str(tmpdir))
+    filename = str(tmpdir.join("mirror.zip"))
+    with zipfile.ZipFile(filename, "w") as archive:
+        for name, text in files.items():
+            archive.writestr(name, text)
+
+    provider = ArchiveProvider(filename)
+    assert provider.get(wrapper.get_url("fastqc")).startswith(b"# Documentation")
+    assert provider.get(wrapper.get_url("multiqc")) is None
+
+
+def test_sources_priority(tmpdir, httpserver):
+    _mirror(str(tmpdir))
+    httpserver.files["/sequana-wrappers/main/wrappers/multiqc/README.md"] = "# Documentation\n\nremote multiqc\n"
+    fetch.configure(sources=[("filesystem", str(tmpdir)), ("http", httpserver.url)])
+
+    assert "local fastqc wrapper" in wrapper.get_rule_doc("fastqc")
+    assert "remote multiqc" in wrapper.get_rule_doc("multiqc")
+    assert "local dag rule" in fetch.fetch(snakemakerule.get_url("dag"))
+    assert len(httpserver.hits) == 1
+
+    # no network at all
+    fetch.configure(sources=[("filesystem", str(tmpdir))])
+    with pytest.raises(fetch.FetchError):
+        fetch.fetch(wrapper.get_url("multiqc"))
+
+    with pytest.raises(ValueError):
+        fetch.configure(sources=[("ftp", None)])
+
+
+@pytest.mark.parametrize("backend", ["threads", "asyncio"])
+def test_sources_fallback(tmpdir, httpserver, backend):
+    _mirror(str(tmpdir))
+    # the mirror fails: the next source is used
+    httpserver.failures["/sequana-wrappers/main/wrappers/fastqc/README.md"] = 10
+    sources = [("http", httpserver.url), ("filesystem", str(tmpdir))]
+    fetch.configure(sources=sources, retries=0, backend=backend)
+    fetch.prefetch([wrapper.get_url("fastqc"), wrapper.get_url("multiqc")])
+    assert "local fastqc wrapper" in fetch.fetch(wrapper.get_url("fastqc"))
+
+    # the error of the last failing source is raised
+    with pytest.raises(fetch.FetchError) as err:
+        fetch.fetch(wrapper.get_url("multiqc"))
+    assert err.value.status == 404
+
+
+def test_sources_unreadable(tmpdir):
+    _mirror(str(tmpdir))
+    corrupted = tmpdir.join("corrupted.zip")
+    corrupted.write("not a zip file")
+    sources = [
+        ("archive", str(tmpdir.join("missing.zip"))),
+        ("archive", str(corrupted)),
+        ("snapshot", str(corrupted)),
+        ("filesystem", str(tmpdir.join("missing"))),
+        ("filesystem", str(tmpdir)),
+    ]
+    # unreadable sources are skipped
+    fetch.configure(sources=sources)
+    assert len(fetch._providers) == 1
+    assert "local fastqc wrapper" in fetch.fetch(wrapper.get_url("fastqc"))
@@ -1,5 +1,13 @@
+import io
+import json
+import tarfile
 import tempfile
 import os
+
+import pytest
+
+from docutils import nodes
+from sequana_sphinxext import engine
 from sequana_sphinxext import snakemakerule
 from sequana_sphinxext import pipeline
 from sequana_sphinxext import wrapper
@@ -87,3 +95,611 @@ def test_wrapper():
 
         app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir, "html")
         app.build()
+
+
+def test_parallel_build():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        names = [f"page{i}" for i in range(8)]
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write(".. toctree::\n\n" + "".join(f"    {x}\n" for x in names))
+        for i, name in enumerate(names):
+            with open(tmpdir + os.sep + f"{name}.rst", "w") as fh:
+                fh.write(f"{name}\n=====\n\n.. sequana_pipeline:: pipe{i}\n\n.. sequana_wrapper:: wrapper{i}\n")
+
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            # no network access in the tests
+            fh.write(data + "sequana_sphinxext_cache_only = True\n")
+
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", parallel=2)
+        assert app.is_parallel_allowed("read")
+        assert app.is_parallel_allowed("write")
+        app.build()
+
+        targets = app.env.sequana_sphinxext_targets
+        assert targets["page3"] == {("sequana_pipeline", "pipe3"), ("sequana_wrapper", "wrapper3")}
+
+        doctree = app.env.get_doctree("page3")
+        node = doctree.next_node(pipeline.sequana_pipeline_rule)
+        assert "pipe3" in node.deepcopy().astext()
+
+
+README = """# Documentation
+
+The **fastqc** wrapper runs FastQC.
+
+# Example
+
+    rule fastqc:
+        input: "test.fastq"
+
+# References
+
+* https://www.bioinformatics.babraham.ac.uk/projects/fastqc/
+"""
+
+
+@pytest.mark.parametrize("backend", ["threads", "asyncio"])
+@pytest.mark.parametrize("workers", [8, 0])
+def test_parallel_fetch(httpserver, backend, workers):
+    # with workers=0, the documents are not prefetched: the parallel readers
+    # fetch them
+    httpserver.files["/sequana-wrappers/main/wrappers/a/README.md"] = "# Documentation\n\nwrapper a\n"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        names = [f"page{i}" for i in range(8)]
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write(".. toctree::\n\n" + "".join(f"    {x}\n" for x in names))
+        for name in names:
+            with open(tmpdir + os.sep + f"{name}.rst", "w") as fh:
+                fh.write(f"{name}\n=====\n\n.. sequana_wrapper:: a missing\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data)
+            fh.write(f"sequana_sphinxext_sources = [('http', {httpserver.url!r})]\n")
+            fh.write(f"sequana_sphinxext_fetch_backend = {backend!r}\n")
+            fh.write(f"sequana_sphinxext_prefetch_workers = {workers}\n")
+
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", parallel=2)
+        app.build()
+        for name in names:
+            text = app.env.get_doctree(name).astext()
+            assert "wrapper a" in text and "not yet available" in text
+
+
+def test_wrapper_rendering(httpserver, monkeypatch):
+    httpserver.files["/fastqc/README.md"] = README
+    monkeypatch.setattr(wrapper, "get_url", lambda name: f"{httpserver.url}/{name}/README.md")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper:: fastqc\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data)
+
+        warnings = io.StringIO()
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", warning=warnings)
+        app.build()
+        assert app.statuscode == 0
+        # no docutils warning raised while parsing the README
+        assert "fastqc" not in warnings.getvalue()
+
+        # the documentation is parsed at read time
+        doctree = app.env.get_doctree("index")
+        node = doctree.next_node(wrapper.sequana_wrapper)
+        assert "The fastqc wrapper runs FastQC." in node.astext()
+
+        with open(tmpdir + "/temp/index.html") as fh:
+            html = fh.read()
+        assert '<div class="sequana_wrapper">' in html
+        assert "<strong>fastqc</strong> wrapper runs FastQC" in html
+        assert '<div class="highlight' in html
+
+
+def test_incremental_build(httpserver, monkeypatch):
+    httpserver.files["/fastqc/README.md"] = README
+    httpserver.files["/multiqc/README.md"] = README.replace("fastqc", "multiqc")
+    monkeypatch.setattr(wrapper, "get_url", lambda name: f"{httpserver.url}/{name}/README.md")
+
+    def build(tmpdir):
+        read = []
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html")
+        app.connect("source-read", lambda app, docname, source: read.append(docname))
+        app.build()
+        return sorted(read)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write(".. toctree::\n\n    fastqc\n    multiqc\n")
+        for name in ("fastqc", "multiqc"):
+            with open(tmpdir + os.sep + f"{name}.rst", "w") as fh:
+                fh.write(f"{name}\n======\n\n.. sequana_wrapper:: {name}\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            # always revalidate the cached documents
+            fh.write(data + "sequana_sphinxext_cache_ttl = 0\n")
+
+        assert build(tmpdir) == ["fastqc", "index", "multiqc"]
+        # nothing changed upstream (documents revalidated with a 304)
+        assert build(tmpdir) == []
+        httpserver.files["/multiqc/README.md"] += "\nnew paragraph\n"
+        assert build(tmpdir) == ["multiqc"]
+
+
+def test_incremental_build_failure(httpserver, monkeypatch):
+    # a page rendered while its document was not available is read again
+    # once the document can be fetched
+    monkeypatch.setattr(wrapper, "get_url", lambda name: f"{httpserver.url}/{name}/README.md")
+    httpserver.files["/fastqc/README.md"] = README
+    httpserver.failures["/fastqc/README.md"] = 1
+
+    def build(tmpdir):
+        read = []
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html")
+        app.connect("source-read", lambda app, docname, source: read.append(docname))
+        app.build()
+        return app, read
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper:: fastqc\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data + "sequana_sphinxext_retries = 0\n")
+
+        app, read = build(tmpdir)
+        assert "not yet available" in app.env.get_doctree("index").astext()
+        app, read = build(tmpdir)
+        assert read == ["index"]
+        assert "runs FastQC" in app.env.get_doctree("index").astext()
+        app, read = build(tmpdir)
+        assert read == []
+
+
+def _wrappers_archive(readmes):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, text in readmes.items():
+            for filename, content in (("README.md", text), ("Snakefile", "rule x:\n")):
+                data = content.encode("utf8")
+                info = tarfile.TarInfo(f"sequana-wrappers-main/wrappers/{name}/{filename}")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_wrapper_catalog(httpserver, monkeypatch):
+    readmes = {name: README.replace("fastqc", name) for name in ("fastqc", "fastp", "multiqc")}
+    httpserver.files["/sequana-wrappers.tar.gz"] = _wrappers_archive(readmes)
+    monkeypatch.setattr(wrapper, "ARCHIVE_URL", httpserver.url + "/sequana-wrappers.tar.gz")
+
+    docs = wrapper.get_catalog_doc("fast*")
+    assert list(docs) == ["fastp", "fastqc"]
+    assert "The **fastp** wrapper runs FastQC." in docs["fastp"]
+
+    # local checkout
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, text in readmes.items():
+            os.makedirs(f"{tmpdir}/wrappers/{name}")
+            with open(f"{tmpdir}/wrappers/{name}/README.md", "w") as fh:
+                fh.write(text)
+        assert list(wrapper.get_catalog_doc(path=tmpdir)) == ["fastp", "fastqc", "multiqc"]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper_catalog::\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data)
+
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html")
+        app.build()
+        doctree = app.env.get_doctree("index")
+        assert len(list(doctree.findall(wrapper.sequana_wrapper))) == 3
+        # the archive is downloaded once per build
+        assert httpserver.hits.count("/sequana-wrappers.tar.gz") == 2
+
+        # the page is read again when the archive changes upstream
+        read = []
+        overrides = {"sequana_sphinxext_cache_ttl": 0}
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", confoverrides=overrides)
+        app.connect("source-read", lambda app, docname, source: read.append(docname))
+        app.build()
+        assert read == []
+        readmes["fastqc"] += "\nnew paragraph\n"
+        httpserver.files["/sequana-wrappers.tar.gz"] = _wrappers_archive(readmes)
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", confoverrides=overrides)
+        app.connect("source-read", lambda app, docname, source: read.append(docname))
+        app.build()
+        assert read == ["index"]
+        assert "new paragraph" in app.env.get_doctree("index").astext()
+
+
+def _invalid_readme_archive():
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        info = tarfile.TarInfo("sequana-wrappers-main/wrappers/fastqc/README.md")
+        info.size = 2
+        tar.addfile(info, io.BytesIO(b"\xff\xfe"))
+    return buffer.getvalue()
+
+
+# the HTML page of a proxy and an archive with a README that is not UTF-8
+@pytest.mark.parametrize("content", [b"<html>proxy</html>", _invalid_readme_archive()], ids=["html", "latin1"])
+def test_wrapper_catalog_invalid(httpserver, monkeypatch, content):
+    httpserver.files["/sequana-wrappers.tar.gz"] = content
+    monkeypatch.setattr(wrapper, "ARCHIVE_URL", httpserver.url + "/sequana-wrappers.tar.gz")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper_catalog::\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data)
+        warnings = io.StringIO()
+        # the build is not aborted
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", warning=warnings)
+        app.build()
+        assert "not a valid archive of the wrappers" in warnings.getvalue()
+
+
+def test_wrapper_glob(httpserver, monkeypatch):
+    readmes = {name: README.replace("fastqc", name) for name in ("fastqc", "fastp", "multiqc")}
+    httpserver.files["/sequana-wrappers.tar.gz"] = _wrappers_archive(readmes)
+    monkeypatch.setattr(wrapper, "ARCHIVE_URL", httpserver.url + "/sequana-wrappers.tar.gz")
+    monkeypatch.setattr(wrapper, "get_url", lambda name: f"{httpserver.url}/{name}/README.md")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper:: fast*\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data)
+
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html")
+        app.build()
+        doctree = app.env.get_doctree("index")
+        assert [node.astext() for node in doctree.findall(nodes.rubric)] == ["fastp", "fastqc"]
+        assert "The fastp wrapper runs FastQC." in doctree.astext()
+        # the READMEs are read from the archive, downloaded once
+        assert httpserver.hits == ["/sequana-wrappers.tar.gz"]
+        assert list(app.env.sequana_sphinxext_sources["index"]) == [wrapper.ARCHIVE_URL]
+
+    # the targets cannot be listed: the build goes on with a warning
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper:: fast*\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data + 'sequana_sphinxext_fetch_mode = "offline"\n')
+        warnings = io.StringIO()
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", warning=warnings)
+        app.build()
+        assert "offline mode is set" in warnings.getvalue()
+
+
+def test_wrapper_sections():
+    readme = README + "\n```\n# not a heading\n```\n# Requirements\n\nfastqc\n"
+    index = wrapper.index_sections(readme)
+    assert list(index) == ["Documentation", "Example", "References", "Requirements"]
+    assert wrapper.get_section(readme, index, "Documentation") == "\nThe **fastqc** wrapper runs FastQC.\n\n"
+    assert wrapper.get_section(readme, index, "Reference").startswith("\n* https://")
+    assert "# not a heading" in wrapper.get_section(readme, index, "References")
+    assert wrapper.get_section(readme, index, "Configuration") is None
+
+    rst = wrapper.format_readme("fastqc", readme, sections=("Example", "Requirements"))
+    assert "**Example**\n::\n\n\n    rule fastqc:" in rst
+    assert "**Requirements**" in rst
+    assert "runs FastQC" not in rst
+
+
+def test_wrapper_sections_option(httpserver, monkeypatch):
+    httpserver.files["/fastqc/README.md"] = README
+    monkeypatch.setattr(wrapper, "get_url", lambda name: f"{httpserver.url}/{name}/README.md")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper:: fastqc\n    :sections: Documentation, References\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data)
+
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html")
+        app.build()
+        text = app.env.get_doctree("index").next_node(wrapper.sequana_wrapper).astext()
+        assert "runs FastQC" in text
+        assert "References" in text
+        assert "rule fastqc" not in text
+
+
+RULES = '''
+rule foo_bar:
+    """foo_bar docstring"""
+    input: "a.txt"
+    output: "b.txt"
+    shell: "cp {input} {output}"
+
+
+rule foo:
+    """Documentation of foo
+
+    :input: a.txt
+    """
+    input:
+        "a.txt",
+        "c.txt"
+    params:
+        option="-v"
+    shell:
+        "cp {input} {output}"
+
+def fastqc_dynamic(name, manager):
+    metadata = {"name": name}
+    fastqc_code = """
+rule fastqc_%(name)s:
+    \'\'\'dynamic fastqc\'\'\'
+    input: "a.fastq"
+"""
+
+rule nodoc:
+    input: "a.txt"
+'''
+
+
+def test_index_rules():
+    rules = snakemakerule.index_rules(RULES)
+    assert sorted(rules) == ["fastqc_%(name)s", "foo", "foo_bar", "nodoc"]
+
+    foo = snakemakerule.find_rule(rules, "foo")
+    assert foo.docstring.startswith("Documentation of foo\n\n    :input: a.txt")
+    assert foo.blocks["input"] == '"a.txt",\n"c.txt"'
+    assert foo.blocks["params"] == 'option="-v"'
+    assert (foo.lineno, foo.end_lineno) == (9, 20)
+
+    assert snakemakerule.find_rule(rules, "foo_bar").docstring == "foo_bar docstring"
+    assert snakemakerule.find_rule(rules, "fastqc_dynamic").docstring == "dynamic fastqc"
+    assert snakemakerule.find_rule(rules, "nodoc").docstring is None
+    assert snakemakerule.find_rule(rules, "fo") is None
+
+
+def test_rule_index_cache(httpserver):
+    httpserver.files["/foo.rules"] = RULES
+    url = httpserver.url + "/foo.rules"
+    index = snakemakerule.get_rule_index(url=url)
+    assert snakemakerule.get_rule_index(url=url) is index
+    assert len(httpserver.hits) == 1
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = tmpdir + os.sep + "foo.rules"
+        with open(filename, "w") as fh:
+            fh.write(RULES)
+        index = snakemakerule.get_rule_index(filename=filename)
+        assert snakemakerule.get_rule_index(filename=filename) is index
+
+
+def test_profile(httpserver, monkeypatch):
+    httpserver.files["/fastqc/README.md"] = README
+    monkeypatch.setattr(wrapper, "get_url", lambda name: f"{httpserver.url}/{name}/README.md")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper:: fastqc\n\n.. sequana_wrapper:: fastqc\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data + "sequana_sphinxext_profile = True\n")
+
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html")
+        app.build()
+
+        with open(tmpdir + "/doctrees/sequana_sphinxext_report.json") as fh:
+            report = json.load(fh)
+        assert len(report["directives"]) == 2
+        record = report["directives"][0]
+        assert (record["docname"], record["directive"], record["target"]) == ("index", "sequana_wrapper", "fastqc")
+        assert record["fetch"] >= 0 and record["parse"] > 0
+        # downloaded once by the prefetch, then read from memory
+        assert report["other_fetches"][0]["status"] == "download"
+        assert report["summary"]["fetches"] == {"download": 1, "memory": 2}
+        assert report["summary"]["bytes"] == len(README)
+
+
+def test_other_builders(httpserver, monkeypatch):
+    httpserver.files["/fastqc/README.md"] = README
+    monkeypatch.setattr(wrapper, "get_url", lambda name: f"{httpserver.url}/{name}/README.md")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. sequana_wrapper:: fastqc\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data)
+
+        outputs = {"text": "index.txt", "latex": "sequana.tex", "man": "sequana.1", "singlehtml": "index.html"}
+        for builder, filename in outputs.items():
+            app = Sphinx(tmpdir, tmpdir, f"{tmpdir}/{builder}", tmpdir + "/doctrees", builder)
+            app.build()
+            with open(f"{tmpdir}/{builder}/{filename}") as fh:
+                assert "wrapper runs FastQC" in fh.read()
+        # the pickled doctree is shared by all builders: fetched once
+        assert httpserver.hits == ["/fastqc/README.md"]
+
+
+class dummy_node(engine.sequana_node):
+    pass
+
+
+DUMMY = engine.SourceKind(
+    "dummy", directive="dummy", node=dummy_node, get_doc=lambda name: f"**{name}** documentation"
+)
+
+
+def test_engine():
+    assert {"wrapper", "pipeline", "rule"} <= set(engine.get_kinds())
+    assert engine.get_kind("snakemakerule").node is snakemakerule.snakemake_rule
+
+    conf = """
+from sequana_sphinxext import engine
+from tests.test_sphinxext import DUMMY
+
+def setup(app):
+    return engine.setup_kind(app, engine.register_kind(DUMMY))
+"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n\n.. dummy:: foo\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(conf)
+
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html")
+        app.build()
+        assert app.env.sequana_sphinxext_targets["index"] == {("dummy", "foo")}
+        assert "foo documentation" in app.env.get_doctree("index").next_node(dummy_node).astext()
+        with open(tmpdir + "/temp/index.html") as fh:
+            assert '<div class="dummy">' in fh.read()
+
+
+def test_multiple_targets(httpserver, monkeypatch):
+    for name in ("fastqc", "multiqc"):
+        httpserver.files[f"/{name}/README.md"] = README.replace("fastqc", name)
+    monkeypatch.setattr(wrapper, "get_url", lambda name: f"{httpserver.url}/{name}/README.md")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in ("foo", "foo_bar", "bar"):
+            os.makedirs(f"{tmpdir}/mirror/sequana/sequana/rules/{name}")
+            with open(f"{tmpdir}/mirror/sequana/sequana/rules/{name}/{name}.rules", "w") as fh:
+                fh.write(f'rule {name}:\n    """{name} docstring"""\n    input: "a"\n')
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write(
+                "Title\n=====\n\n.. sequana_wrapper:: fastqc, multiqc\n    :sections: Documentation\n\n"
+                ".. snakemakerule:: foo*\n    bar\n    dummy_*\n"
+            )
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(
+                data
+                + "sequana_sphinxext_use_pipetools = False\n"
+                + f"sequana_sphinxext_sources = [('filesystem', '{tmpdir}/mirror'), ('http', None)]\n"
+            )
+
+        warnings = io.StringIO()
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", warning=warnings)
+        app.build()
+        assert "No rule matches dummy_*" in warnings.getvalue()
+        assert app.env.sequana_sphinxext_targets["index"] == {
+            ("sequana_wrapper", "fastqc"),
+            ("sequana_wrapper", "multiqc"),
+            ("snakemakerule", "foo"),
+            ("snakemakerule", "foo_bar"),
+            ("snakemakerule", "bar"),
+        }
+
+        doctree = app.env.get_doctree("index")
+        rubrics = [node.astext() for node in doctree.findall(nodes.rubric)]
+        assert rubrics == ["fastqc", "multiqc", "foo", "foo_bar", "bar"]
+        rules = [node.astext() for node in doctree.findall(snakemakerule.snakemake_rule)]
+        assert rules == ["foo docstring", "foo_bar docstring", "bar docstring"]
+        assert sorted(httpserver.hits) == ["/fastqc/README.md", "/multiqc/README.md"]
+
+
+PIPELINE_README = """Overview
+========
+
+The fastqc pipeline, see `sequana <https://sequana.readthedocs.io>`_.
+
+Usage
+=====
+
+::
+
+    sequana_fastqc --help
+"""
+
+
+def test_render_cache(httpserver, monkeypatch):
+    httpserver.files["/fastqc/README.rst"] = PIPELINE_README
+    monkeypatch.setattr(pipeline, "get_url", lambda name: f"{httpserver.url}/{name}/README.rst")
+    parsed = []
+    nested_parse = engine.nested_parse_with_titles
+    monkeypatch.setattr(engine, "nested_parse_with_titles", lambda *args: parsed.append(1) or nested_parse(*args))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write(".. toctree::\n\n    a\n    b\n")
+        with open(tmpdir + os.sep + "a.rst", "w") as fh:
+            fh.write("A\n=\n\n.. sequana_pipeline:: fastqc\n\n.. sequana_pipeline:: fastqc\n")
+        with open(tmpdir + os.sep + "b.rst", "w") as fh:
+            fh.write("B\n=\n\n.. sequana_pipeline:: fastqc\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            fh.write(data)
+
+        def build(**kwargs):
+            warnings = io.StringIO()
+            app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", warning=warnings, **kwargs)
+            app.build()
+            assert "a.rst" not in warnings.getvalue()
+            return app
+
+        app = build()
+        # parsed once for the three directives
+        assert len(parsed) == 1
+        doctree = app.env.get_doctree("a")
+        sections = [section for node in doctree.findall(engine.sequana_node) for section in node.findall(nodes.section)]
+        ids = [x for section in sections for x in section["ids"]]
+        assert len(sections) == 4 and len(set(ids)) == 4
+        with open(tmpdir + "/temp/b.html") as fh:
+            html = fh.read()
+        assert 'id="overview"' in html and 'href="https://sequana.readthedocs.io"' in html
+
+        # and not parsed again on the next builds
+        build(freshenv=True)
+        assert len(parsed) == 1
+        build(freshenv=True, confoverrides={"sequana_sphinxext_render_cache": False})
+        assert len(parsed) == 4
+
+        # anonymous references are not cached
+        httpserver.files["/fastqc/README.rst"] = PIPELINE_README + "\nSee `sequana`__.\n\n__ https://sequana.readthedocs.io\n"
+        del parsed[:]
+        build(freshenv=True, confoverrides={"sequana_sphinxext_cache_ttl": 0})
+        build(freshenv=True, confoverrides={"sequana_sphinxext_cache_ttl": 0})
+        assert len(parsed) == 6
+        with open(tmpdir + "/temp/a.html") as fh:
+            assert fh.read().count('href="https://sequana.readthedocs.io"') == 4
+
+
+def test_render_cache_xref(httpserver, monkeypatch):
+    # cross-references are resolved relatively to the page using them
+    httpserver.files["/fastqc/README.rst"] = "See :doc:`/other` and :ref:`mylabel`.\n\nUse `fastqc`.\n"
+    monkeypatch.setattr(pipeline, "get_url", lambda name: f"{httpserver.url}/{name}/README.rst")
+    parsed = []
+    nested_parse = engine.nested_parse_with_titles
+    monkeypatch.setattr(engine, "nested_parse_with_titles", lambda *args: parsed.append(1) or nested_parse(*args))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.makedirs(tmpdir + "/sub")
+        with open(tmpdir + "/index.rst", "w") as fh:
+            fh.write("Index\n=====\n\n.. toctree::\n\n    other\n    sub/page\n\n.. sequana_pipeline:: fastqc\n")
+        with open(tmpdir + "/other.rst", "w") as fh:
+            fh.write(".. _mylabel:\n\nOther\n=====\n")
+        with open(tmpdir + "/sub/page.rst", "w") as fh:
+            fh.write("Page\n====\n\n.. sequana_pipeline:: fastqc\n")
+        with open(tmpdir + "/conf.py", "w") as fh:
+            fh.write(data)
+
+        def build(**kwargs):
+            app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", **kwargs)
+            app.build()
+            return app
+
+        build()
+        with open(tmpdir + "/temp/sub/page.html") as fh:
+            html = fh.read()
+        assert 'href="../other.html"' in html and 'href="../other.html#mylabel"' in html
+        assert len(parsed) == 2
+
+        # the configuration values that change the parsing are in the key
+        httpserver.files["/fastqc/README.rst"] = "Use `fastqc`.\n"
+        build(freshenv=True, confoverrides={"sequana_sphinxext_cache_ttl": 0})
+        assert len(parsed) == 3
+        app = build(freshenv=True, confoverrides={"default_role": "literal"})
+        assert len(parsed) == 4
+        assert app.env.get_doctree("index").next_node(nodes.literal) is not None
+
+
+def test_config_types():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(tmpdir + os.sep + "index.rst", "w") as fh:
+            fh.write("Title\n=====\n")
+        with open(tmpdir + os.sep + "conf.py", "w") as fh:
+            # documented values
+            fh.write(data + "sequana_sphinxext_max_bytes = None\nsequana_sphinxext_timeout = [1, 2]\n")
+        warnings = io.StringIO()
+        app = Sphinx(tmpdir, tmpdir, tmpdir + "/temp", tmpdir + "/doctrees", "html", warning=warnings)
+        app.build()
+        assert "has type" not in warnings.getvalue()